@@ -1,16 +1,115 @@
+import logging
+import multiprocessing
+import threading
+import time
+
 import pyaudio
 import numpy as np
-import struct
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class SpectrumAnalyser(object):
+    """ Splits sound in overlapping windowed frames, transforms them with a real FFT and sums the power in
+        log-spaced frequency bands, which are smoothed over time.
+
+        :param sound_rate: Sample rate of the analysed sound
+        :param band_count: Number of frequency bands
+        :param fft_size: Number of samples in a frame
+        :param frame_count: Number of overlapping frames averaged in one analysis
+        :param overlap: Fraction of a frame overlapping with the next frame
+        :param frequency_min: Lower frequency of the lowest band (Hz)
+        :param frequency_max: Upper frequency of the highest band (Hz), capped at the Nyquist frequency
+        :param attack: Smoothing factor for rising bands, 1 follows the sound immediately
+        :param release: Smoothing factor for falling bands, 1 follows the sound immediately
+        :param db_range: Dynamic range mapped to band levels between 0 and 1 (dB)
+        :param cpu_budget: Time an analysis may take (seconds), analyses taking longer are counted
+
+        :ivar bands: Levels of the frequency bands between 0 and 1
+        :ivar analysis_time: Duration of the latest analysis (seconds)
+        :ivar over_budget_count: Number of analyses that exceeded the CPU budget
+    """
+    def __init__(self, sound_rate=44100, band_count=32, fft_size=1024, frame_count=3, overlap=0.5,
+                 frequency_min=40, frequency_max=16000, attack=0.6, release=0.15, db_range=60, cpu_budget=0.002):
+        self.sound_rate = sound_rate
+        self.band_count = band_count
+        self.fft_size = fft_size
+        self.hop_size = max(1, int(fft_size * (1 - overlap)))
+        self.window_length = fft_size + self.hop_size * (frame_count - 1)  # Samples needed for one analysis
+        self.attack = attack
+        self.release = release
+        self.db_range = db_range
+        self.cpu_budget = cpu_budget
+        self.bands = np.zeros(band_count, dtype=np.float32)
+        self.analysis_time = 0
+        self.over_budget_count = 0
+        self.__window = np.hanning(fft_size).astype(np.float32)
+        # Power of a full scale sine in a single FFT bin, the 0 dB reference
+        self.__power_full_scale = (32767 * self.__window.sum() / 2) ** 2
+        # FFT bins summed per band, every band gets at least one bin
+        bin_count = fft_size // 2 + 1
+        bin_width = sound_rate / fft_size
+        frequency_max = min(frequency_max, sound_rate / 2)
+        edges = np.geomspace(frequency_min, frequency_max, band_count + 1) / bin_width
+        self.__bin_low = np.clip(np.floor(edges[:-1]).astype(int), 1, bin_count - 1)
+        self.__bin_high = np.clip(np.maximum(np.ceil(edges[1:]).astype(int), self.__bin_low + 1), 1, bin_count)
+
+    def analyse(self, samples):
+        """ Analyses the latest samples.
+
+            :param samples: NumPy array of 16 bit samples, oldest first
+            :return: The smoothed band levels, a float32 array of band_count values between 0 and 1
+        """
+        time_start = time.perf_counter()
+        samples = np.asarray(samples[-self.window_length:], dtype=np.float32)
+        if len(samples) < self.fft_size:
+            samples = np.pad(samples, (self.fft_size - len(samples), 0))
+        frames = sliding_window_view(samples, self.fft_size)[::self.hop_size]
+        spectrum = np.fft.rfft(frames * self.__window, axis=1)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2).mean(axis=0)
+        power_cumulative = np.concatenate(([0.0], np.cumsum(power)))
+        band_power = (power_cumulative[self.__bin_high] - power_cumulative[self.__bin_low]) / \
+                     (self.__bin_high - self.__bin_low)
+        levels = 10 * np.log10(band_power / self.__power_full_scale + 1e-12)
+        levels = np.clip(1 + levels / self.db_range, 0, 1)
+        smoothing = np.where(levels > self.bands, self.attack, self.release)
+        self.bands += (levels - self.bands) * smoothing
+        self.analysis_time = time.perf_counter() - time_start
+        if self.analysis_time > self.cpu_budget:
+            self.over_budget_count += 1
+        return self.bands
+
 
 class AudioSpectrometer(object):
-    def __init__(self, name_device='default', block_time=0.005, sound_rate=10000):
+    """ Captures sound from an input device and analyses its loudness and spectrum.
+
+        :param name_device: Name of the preferred input device
+        :param block_time: Duration of a block of sound that is analysed (seconds)
+        :param sound_rate: Sample rate of the captured sound
+        :param use_callback: Capture in PyAudio's callback thread, so listen() never blocks on the device
+        :param ring_size: Number of samples kept in the ring buffer
+        :param band_count: Number of frequency bands of the spectrum
+    """
+    def __init__(self, name_device='default', block_time=0.005, sound_rate=10000, use_callback=True, ring_size=4096,
+                 band_count=32):
         self.pa = pyaudio.PyAudio()
         self.name_device = name_device
         self.sound_rate = sound_rate
         self.frames_per_block = int(sound_rate * block_time)
+        self.use_callback = use_callback
+        self.amplitude = 0  # Loudness of the latest analysis
+        self.analyser = SpectrumAnalyser(sound_rate=sound_rate, band_count=band_count)
+        self.spectrum = np.zeros(band_count, dtype=np.float32)  # Band levels of the latest analysis
+        self.overflow_count = 0  # Number of input overflows since the last analysis
+        self.ring_buffer = np.zeros(max(ring_size, self.frames_per_block, self.analyser.window_length), dtype=np.int16)
+        self.__ring_index = 0  # Position in the ring buffer the next sample is written to
+        self.__frames_captured = 0  # Total number of samples written to the ring buffer
+        self.__frames_analysed = 0  # Value of frames captured at the latest analysis
+        self.__lock = threading.Lock()
         self.stream = self.open_sound_stream()
 
     def stop(self):
+        if self.stream.is_active():
+            self.stream.stop_stream()
         self.stream.close()
 
     def find_input_device(self):
@@ -31,22 +130,163 @@ class AudioSpectrometer(object):
                               rate = self.sound_rate,
                               input = True,
                               input_device_index = device_index,
-                              frames_per_buffer = self.frames_per_block)
+                              frames_per_buffer = self.frames_per_block,
+                              stream_callback = self.__stream_callback if self.use_callback else None)
         return stream
 
+    def __stream_callback(self, in_data, frame_count, time_info, status_flags):
+        """ Called from PyAudio's capture thread with each block of sound. """
+        block = np.frombuffer(in_data, dtype=np.int16)
+        with self.__lock:
+            self.__ring_write(block)
+            if status_flags & pyaudio.paInputOverflow:
+                self.overflow_count += 1
+        return None, pyaudio.paContinue
+
+    def __ring_write(self, block):
+        """ Copies a block of samples into the ring buffer, overwriting the oldest samples. """
+        size = len(self.ring_buffer)
+        block = block[-size:]
+        end = self.__ring_index + len(block)
+        if end <= size:
+            self.ring_buffer[self.__ring_index:end] = block
+        else:
+            split = size - self.__ring_index
+            self.ring_buffer[self.__ring_index:] = block[:split]
+            self.ring_buffer[:end - size] = block[split:]
+        self.__ring_index = end % size
+        self.__frames_captured += len(block)
+
+    def ring_read(self, frame_count):
+        """ :return: Copy of the latest frame_count samples from the ring buffer, oldest first. """
+        size = len(self.ring_buffer)
+        frame_count = min(frame_count, size)
+        start = (self.__ring_index - frame_count) % size
+        if start + frame_count <= size:
+            return self.ring_buffer[start:start + frame_count].copy()
+        return np.concatenate((self.ring_buffer[start:], self.ring_buffer[:self.__ring_index]))
+
     def get_rms(self, block):
         return np.sqrt(np.mean(np.square(block)))
 
     def listen(self):
-        amplitude=0
+        """ Analyses the latest sound, the band levels are available in 'spectrum'. Doesn't wait for the
+            sound device when capturing with a callback, but returns the latest analysis instead.
+
+            :return: The amplitude of the latest block of sound.
+        """
+        if not self.use_callback:
+            return self.__listen_blocking()
+        with self.__lock:
+            if self.__frames_captured == self.__frames_analysed:  # Nothing new captured
+                return self.amplitude
+            self.__frames_analysed = self.__frames_captured
+            snd_samples = self.ring_read(self.analyser.window_length)
+            overflow_count, self.overflow_count = self.overflow_count, 0
+        if overflow_count > 0:
+            logging.warning("Sound input overflowed %d times", overflow_count)
+        self.__analyse(snd_samples)
+        return self.amplitude
+
+    def __listen_blocking(self):
         try:
             raw_block = self.stream.read(self.frames_per_block, exception_on_overflow = False)
-            format = '%dh' % (len(raw_block) / 2)
-            snd_block = np.array(struct.unpack(format, raw_block))
-            amplitude = self.get_rms(snd_block)
+            self.__ring_write(np.frombuffer(raw_block, dtype=np.int16))
+            self.__analyse(self.ring_read(self.analyser.window_length))
         except Exception as e:
             print('Error recording: {}'.format(e))
-        return amplitude
+            self.amplitude = 0
+        return self.amplitude
+
+    def __analyse(self, snd_samples):
+        self.amplitude = self.get_rms(snd_samples[-self.frames_per_block:].astype(np.float32))
+        self.spectrum = self.analyser.analyse(snd_samples)
+
+
+def frame_views(buffer, band_count):
+    """ Lays out a shared frame: a sequence number followed by the amplitude and the band levels.
+
+        :return: Tuple of the sequence number array and the frame array, both views on the buffer
+    """
+    sequence = np.ndarray((1,), dtype=np.uint64, buffer=buffer)
+    frame = np.ndarray((band_count + 1,), dtype=np.float32, buffer=buffer, offset=sequence.nbytes)
+    return sequence, frame
+
+
+def spectrometer_process_run(memory_name, band_count, stop_event, spectrometer_args):
+    """ Captures and analyses sound in a separate process, publishing each analysis to shared memory.
+        The sequence number is odd while a frame is written, so readers can detect torn frames.
+    """
+    from multiprocessing.shared_memory import SharedMemory
+    memory = SharedMemory(name=memory_name)
+    sequence, frame = frame_views(memory.buf, band_count)
+    spectrometer = AudioSpectrometer(use_callback=False, band_count=band_count, **spectrometer_args)
+    try:
+        while not stop_event.is_set():
+            amplitude = spectrometer.listen()  # Blocks on the sound device, which paces the loop
+            sequence[0] += 1
+            frame[0] = amplitude
+            frame[1:] = spectrometer.spectrum
+            sequence[0] += 1
+    finally:
+        spectrometer.stop()
+        del sequence, frame
+        memory.close()
+
+
+class AudioSpectrometerProcess(object):
+    """ Runs an AudioSpectrometer in its own process, so sound analysis doesn't compete with the
+        interface for the GIL. Reading the analysis only copies the newest frame from shared memory.
+
+        :param name_device: Name of the preferred input device
+        :param block_time: Duration of a block of sound that is analysed (seconds)
+        :param sound_rate: Sample rate of the captured sound
+        :param band_count: Number of frequency bands of the spectrum
+    """
+    def __init__(self, name_device='default', block_time=0.005, sound_rate=10000, band_count=32):
+        self.amplitude = 0  # Loudness of the latest analysis
+        self.spectrum = np.zeros(band_count, dtype=np.float32)  # Band levels of the latest analysis
+        self.read_attempts = 3  # Times a torn frame is reread before keeping the previous analysis
+        from multiprocessing.shared_memory import SharedMemory  # Python 3.8+, only needed for the process
+        memory_size = np.dtype(np.uint64).itemsize + (band_count + 1) * np.dtype(np.float32).itemsize
+        self.__memory = SharedMemory(create=True, size=memory_size)
+        self.__sequence, self.__frame = frame_views(self.__memory.buf, band_count)
+        self.__sequence[0] = 0
+        self.__frame_copy = np.zeros_like(self.__frame)
+        # Forked, so the interface modules aren't imported again in the child
+        context = multiprocessing.get_context('fork')
+        self.__stop_event = context.Event()
+        spectrometer_args = {'name_device': name_device, 'block_time': block_time, 'sound_rate': sound_rate}
+        self.process = context.Process(target=spectrometer_process_run, name='audio_spectrometer', daemon=True,
+                                       args=(self.__memory.name, band_count, self.__stop_event, spectrometer_args))
+        self.process.start()
+
+    def stop(self):
+        self.__stop_event.set()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+        del self.__sequence, self.__frame
+        self.__memory.close()
+        self.__memory.unlink()
+
+    def listen(self):
+        """ Reads the newest analysis published by the spectrometer process, the band levels are
+            available in 'spectrum'. Never waits for the process.
+
+            :return: The amplitude of the latest block of sound.
+        """
+        for attempt in range(self.read_attempts):
+            sequence_start = int(self.__sequence[0])
+            if sequence_start % 2 == 1:  # Frame being written
+                continue
+            np.copyto(self.__frame_copy, self.__frame)
+            if int(self.__sequence[0]) == sequence_start:
+                self.amplitude = float(self.__frame_copy[0])
+                self.spectrum = self.__frame_copy[1:].copy()  # The copy is overwritten by the next read
+                break
+        return self.amplitude
+
 
 if __name__ == '__main__':
 
@@ -55,4 +295,6 @@ if __name__ == '__main__':
     running = True
     while running:
         amplitude = audio.listen()
-        print(amplitude)
\ No newline at end of file
+        print('{:8.1f} {:5.2f} ms {}'.format(amplitude, audio.analyser.analysis_time * 1000,
+                                             ''.join(' .:-=+*#%@'[int(level * 9)] for level in audio.spectrum)))
+        time.sleep(audio.frames_per_block / audio.sound_rate)
@@ -0,0 +1,4 @@
+import os
+
+# Tests draw on an off-screen display, settings opens the display when it's imported
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
@@ -0,0 +1,219 @@
+# This file is part of pi-jukebox.
+#
+# pi-jukebox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-jukebox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pi-jukebox. If not, see < http://www.gnu.org/licenses/ >.
+#
+# (C) 2015- by Mark Zwart, <mark.zwart@pobox.com>
+"""
+=======================================================
+**cover_art.py**: Cover art and the images derived from it.
+=======================================================
+"""
+import hashlib
+import io
+import json
+import logging
+import shutil
+from collections import OrderedDict
+
+from PIL import Image, ImageFilter, ImageEnhance
+
+from settings import *
+from gui_widgets import colors_dominant
+from mpd_client import DEFAULT_COVER
+
+
+def surface_from_image(image):
+    """ :return: A pygame surface with the pixels of an RGB PIL image. """
+    return pygame.image.frombuffer(image.tobytes(), image.size, 'RGB')
+
+
+class CoverArt(object):
+    """ Decodes cover art once and derives the cover, blurred background and color theme from it in memory.
+
+        :param cover_dims: Size of the cover picture
+        :param background_dims: Size of the background picture
+        :param qty_colors: Number of dominant colors determined
+
+        :ivar blob: The cover art's image bytes, None for the default cover
+        :ivar cover: Surface with the cover scaled to cover_dims
+        :ivar background: Surface with the blurred and darkened cover filling background_dims
+        :ivar colors: The dominant colors at the bottom of the cover
+        :ivar background_zoom_stack: The background pre-scaled for zooming, see Picture.zoom_stack_create
+    """
+
+    def __init__(self, cover_dims, background_dims, qty_colors=3):
+        self.cover_dims = tuple(cover_dims)
+        self.background_dims = tuple(background_dims)
+        self.qty_colors = qty_colors
+        self.blob = None
+        self.cover = None
+        self.background = None
+        self.colors = []
+        self.background_zoom_stack = None
+
+    def render(self, blob):
+        """ Derives the cover, background and colors from the cover art.
+
+            :param blob: The cover art's image bytes, None for the default cover
+        """
+        self.blob = blob
+        image = self.__decode(blob)
+        cover = image.resize(self.cover_dims)
+        self.cover = surface_from_image(cover)
+        self.background = surface_from_image(self.__background_render(image))
+        self.colors = colors_dominant(cover.crop((0, cover.height - 30, cover.width, cover.height)), self.qty_colors)
+
+    def __decode(self, blob):
+        if blob is not None:
+            try:
+                return Image.open(io.BytesIO(blob)).convert('RGB')
+            except OSError:
+                logging.warning("Could not decode cover art, using default cover")
+        return Image.open(DEFAULT_COVER).convert('RGB')
+
+    def __background_render(self, image):
+        """ Blurs and darkens the image, scaled to the background's width and cropped to its height. """
+        width, height = self.background_dims
+        image = image.resize((width, width))
+        image = image.crop((0, (width - height) / 2, width, width - (width - height) / 2))
+        image = image.filter(ImageFilter.GaussianBlur(8))
+        return ImageEnhance.Brightness(image).enhance(0.6)
+
+
+class CoverArtCache(object):
+    """ Cover art stored on disk with its rendered cover, background and colors, so playing an album again
+        doesn't need mpd or image processing. Albums point to cover art addressed by a hash of the image bytes;
+        the least recently used cover art is removed when the cache grows over its maximum size.
+
+        :param directory: Directory the cache is stored in
+        :param size_max: Maximum size of the cache (bytes)
+    """
+
+    def __init__(self, directory=COVER_CACHE_DIR, size_max=COVER_CACHE_SIZE_MAX):
+        self.directory = directory
+        self.size_max = size_max
+        self.__dir_albums = os.path.join(directory, 'albums')
+        self.__dir_art = os.path.join(directory, 'art')
+        os.makedirs(self.__dir_albums, exist_ok=True)
+        os.makedirs(self.__dir_art, exist_ok=True)
+        self.__entries = OrderedDict()  # Size of cover art entries by hash, least recently used first
+        self.__size = 0
+        self.__entries_scan()
+
+    def __entries_scan(self):
+        entries = []
+        for art_hash in os.listdir(self.__dir_art):
+            dir_entry = os.path.join(self.__dir_art, art_hash)
+            size = sum(entry.stat().st_size for entry in os.scandir(dir_entry))
+            entries.append((os.stat(dir_entry).st_mtime, art_hash, size))
+        for time_used, art_hash, size in sorted(entries):
+            self.__entries[art_hash] = size
+            self.__size += size
+
+    def key_get(self, artist, album):
+        """ :return: The key of an album in the cache, None if the album is unknown. """
+        if album in ('', 'Unknown'):
+            return None
+        return hashlib.sha1((artist + '\n' + album).encode('utf-8')).hexdigest()
+
+    def load(self, key, cover_art):
+        """ Fills cover art with the album's cached cover, background and colors. When cached for
+            different sizes they're rendered again from the cached image bytes.
+
+            :param key: The album's key
+            :param cover_art: CoverArt that is filled
+            :return: Boolean indicating whether the album was found in the cache
+        """
+        if key is None:
+            return False
+        file_album = os.path.join(self.__dir_albums, key)
+        try:
+            with open(file_album) as file:
+                art_hash = file.read().strip()
+            dir_entry = os.path.join(self.__dir_art, art_hash)
+            with open(os.path.join(dir_entry, 'meta.json')) as file:
+                meta = json.load(file)
+            if tuple(meta['cover_dims']) == cover_art.cover_dims and \
+                    tuple(meta['background_dims']) == cover_art.background_dims:
+                cover_art.blob = None  # Not needed once rendered
+                cover_art.cover = self.__surface_read(os.path.join(dir_entry, 'cover.rgb'), cover_art.cover_dims)
+                cover_art.background = self.__surface_read(os.path.join(dir_entry, 'background.rgb'),
+                                                            cover_art.background_dims)
+                cover_art.colors = [tuple(color) for color in meta['colors']]
+            else:
+                with open(os.path.join(dir_entry, 'original'), 'rb') as file:
+                    cover_art.render(file.read())
+                self.__entry_write(art_hash, cover_art)
+        except (OSError, ValueError, KeyError):
+            logging.info("Cover art of album %s not in cache", key)
+            return False
+        self.__entry_used(art_hash)
+        return True
+
+    def save(self, key, cover_art):
+        """ Stores rendered cover art for an album.
+
+            :param key: The album's key
+            :param cover_art: CoverArt rendered from image bytes
+        """
+        if key is None or cover_art.blob is None:
+            return
+        art_hash = hashlib.sha1(cover_art.blob).hexdigest()
+        try:
+            if art_hash not in self.__entries:
+                os.makedirs(os.path.join(self.__dir_art, art_hash), exist_ok=True)
+                self.__file_write(os.path.join(self.__dir_art, art_hash, 'original'), cover_art.blob)
+            self.__entry_write(art_hash, cover_art)
+            self.__file_write(os.path.join(self.__dir_albums, key), art_hash.encode('utf-8'))
+        except OSError:
+            logging.exception("Could not store cover art in cache")
+            return
+        self.__entry_used(art_hash)
+        self.__evict()
+
+    def __entry_write(self, art_hash, cover_art):
+        """ Writes the rendered cover, background and colors of the cover art. """
+        dir_entry = os.path.join(self.__dir_art, art_hash)
+        self.__file_write(os.path.join(dir_entry, 'cover.rgb'), pygame.image.tostring(cover_art.cover, 'RGB'))
+        self.__file_write(os.path.join(dir_entry, 'background.rgb'),
+                          pygame.image.tostring(cover_art.background, 'RGB'))
+        meta = {'cover_dims': cover_art.cover_dims, 'background_dims': cover_art.background_dims,
+                'colors': cover_art.colors}
+        self.__file_write(os.path.join(dir_entry, 'meta.json'), json.dumps(meta).encode('utf-8'))
+        size = sum(entry.stat().st_size for entry in os.scandir(dir_entry))
+        self.__size += size - self.__entries.get(art_hash, 0)
+        self.__entries[art_hash] = size
+
+    def __entry_used(self, art_hash):
+        """ Marks cover art as most recently used, also on disk for the next start. """
+        self.__entries.move_to_end(art_hash)
+        os.utime(os.path.join(self.__dir_art, art_hash))
+
+    def __evict(self):
+        """ Removes the least recently used cover art until the cache fits its maximum size. """
+        while self.__size > self.size_max and len(self.__entries) > 1:
+            art_hash, size = self.__entries.popitem(last=False)
+            logging.info("Removing cover art %s from cache", art_hash)
+            shutil.rmtree(os.path.join(self.__dir_art, art_hash), ignore_errors=True)
+            self.__size -= size
+
+    def __file_write(self, file_name, data):
+        """ Writes a file atomically, so an interrupted write never leaves a corrupt cache entry. """
+        with open(file_name + '.tmp', 'wb') as file:
+            file.write(data)
+        os.replace(file_name + '.tmp', file_name)
+
+    def __surface_read(self, file_name, dims):
+        with open(file_name, 'rb') as file:
+            return pygame.image.frombuffer(file.read(), dims, 'RGB')
@@ -22,6 +22,7 @@ __author__ = 'Mark Zwart'
 #
 # (C) 2015- by Mark Zwart, <mark.zwart@pobox.com>
 import asyncio
+from collections import OrderedDict
 
 from gui_widgets import *
 from settings import *
@@ -48,6 +49,9 @@ ICO_ERROR = RESOURCES + 'icon_warning.png'
 
 #: Time-out period before screen goes blank (milliseconds)
 BLANK_PERIOD = 40000 # 300000
+#: Period over which the achieved frame rate is reported (seconds)
+FRAME_RATE_REPORT_PERIOD = 60
+LAYER_CACHE_SIZE = 12  # Number of composed background layers kept, at least one for each zoom level of a picture
 
 
 class GestureDetector(object):
@@ -61,32 +65,28 @@ class GestureDetector(object):
         self.y_moved = 0
         self.drag_length = 0
         self.press_duration = 0
+        self.mouse_down_time = None  # Time the gesture started, None when no gesture is being made
         self.x_start, self.y_start = pygame.mouse.get_pos()
 
     def capture_gesture(self, event):
-        """ Mouse event loop, runs from mouse down to mouse up event.
+        """ Follows a gesture from mouse down to mouse up event, without waiting for the mouse up event, so the
+            screen keeps updating while the gesture is made.
 
-            :param event: pygame event
+            :param event: pygame mouse event
+            :return: The type of gesture ended by a mouse up event, :py:const:GESTURE_NONE while it goes on
         """
-
-        if event.type != pygame.MOUSEBUTTONDOWN:
+        if event.type == pygame.MOUSEBUTTONDOWN:  # Gesture start
+            self.x_start, self.y_start = event.pos  # Click position (= start position for swipe)
+            self.mouse_down_time = pygame.time.get_ticks()
+            self.gesture = GESTURE_NONE
             return GESTURE_NONE
-
-        gesture_ended = False
-
-        self.x_start, self.y_start = pygame.mouse.get_pos()  # Get click position (= start position for swipe)
-        pygame.mouse.get_rel()  # Start tracking mouse movement
-        mouse_down_time = pygame.time.get_ticks()
-
-        while not gesture_ended:
-            for event in pygame.event.get():
-
-                if event.type == pygame.MOUSEBUTTONUP:  # Gesture end
-                    self.press_duration = pygame.time.get_ticks() - mouse_down_time
-                    self.x_moved, self.y_moved = pygame.mouse.get_rel()  # Movements since start gesture
-                    self.gesture = self.__determine_gesture_type()  # Determines the kind of gesture used
-                    gesture_ended = True
-
+        if event.type != pygame.MOUSEBUTTONUP or self.mouse_down_time is None:
+            return GESTURE_NONE
+        self.press_duration = pygame.time.get_ticks() - self.mouse_down_time  # Gesture end
+        self.mouse_down_time = None
+        self.x_moved = event.pos[0] - self.x_start  # Movements since start gesture
+        self.y_moved = event.pos[1] - self.y_start
+        self.gesture = self.__determine_gesture_type()  # Determines the kind of gesture used
         return self.gesture
 
     def __determine_gesture_type(self):
@@ -162,6 +162,10 @@ class Screen(object):
 
         :ivar components: Dictionary holding the screen's widgets with a tag_name as key and the widget as value
         :ivar color: The screen's background color, default = :py:const:BLACK
+        :ivar layer_background: Surface for widgets that seldom change, composed once and then copied to the screen
+        :ivar layer_foreground: Surface for widgets that change often, drawn on the screen over the background layer
+        :ivar frame_rate: The number of screen updates per second achieved by the loop
+        :ivar frames_skipped: The number of frames skipped because updating the screen took too long
     """
 
     def __init__(self, screen_or_surface):
@@ -176,37 +180,121 @@ class Screen(object):
         self.components = {}  # Interface dictionary
         self.color = BLACK
         self.gesture_detect = GestureDetector()
+        self.frame_rate = 0
+        self.frames_skipped = 0
+        self.frame_drawn = False  # Whether anything was drawn in the current frame
+        self.screen_next = None  # Screen opened over this one, shown by the loop
+        self.layer_foreground = self.surface
+        self.layer_background = pygame.Surface(self.surface.get_size()).convert()
+        self.__components_background = []  # Widgets drawn on the background layer
+        self.__layer_background_cache = OrderedDict()  # Composed background layers by widget states
+        self.__layer_background_state = None  # Widget states of the background layer showing
 
     def add_component(self, widget):
-        """ Adds components to component list, thus ensuring a component is found on a mouse event.
+        """ Adds components to component list, thus ensuring a component is found on a mouse event. Widgets
+            created on the layer_background surface are drawn on the background layer.
 
             :param widget: The widget that should be added to the dictionary
         """
         self.components[widget.name] = widget
+        if widget.screen is self.layer_background:
+            self.__components_background.append(widget)
+
+    def layer_background_render(self):
+        """ Makes the background layer show the current state of its widgets, composing it only when that
+            state wasn't composed recently.
+
+            :return: Boolean indicating whether the background layer changed
+        """
+        state = tuple(component.layer_state() if component.visible else None
+                      for component in self.__components_background)
+        if state == self.__layer_background_state:
+            return False
+        self.__layer_background_state = state
+        layer = self.__layer_background_cache.pop(state, None)
+        if layer is None:
+            if len(self.__layer_background_cache) >= LAYER_CACHE_SIZE:
+                layer = self.__layer_background_cache.popitem(last=False)[1]  # Reuses the oldest layer's surface
+            else:
+                layer = pygame.Surface(self.surface.get_size()).convert()
+            layer.fill(self.color)
+            for component in self.__components_background:
+                component.screen = layer
+                if component.visible:
+                    component.draw()
+        self.__layer_background_cache[state] = layer
+        self.layer_background = layer
+        return True
 
     async def show(self):
         self.loop_active = True
         """ Displays the screen. """
         if self.parent_screen is not None:
             self.parent_screen.active = False
-        self.surface.fill(self.color)
-        for key, value in self.components.items():
-            if value.visible:
-                value.draw()
-        pygame.display.flip()
-        task_loop = asyncio.create_task(self.loop())
-        await task_loop
+        self.draw_full()
+        await self.loop()
 
-    def redraw(self):
-        self.surface.fill(self.color)
+    def draw_full(self):
+        """ Draws the whole screen. """
+        self.layer_background_render()
+        self.surface.blit(self.layer_background, (0, 0))
         for key, value in self.components.items():
-            if value.visible:
+            if value.visible and value not in self.__components_background:
                 value.draw()
+        self.components_drawn()
         pygame.display.flip()
+        self.frame_drawn = True
 
-    def update(self):
+    def redraw(self):
+        """ Redraws the parts of the screen with changed widgets: the background layer is copied to those parts,
+            the foreground widgets overlapping them are drawn again, clipped to them, and only they are updated on
+            the display.
+        """
+        rects_dirty = []
+        rects_background = []
+        for component in self.components.values():
+            if component.visible:
+                component.animate()
+            if component.dirty:
+                rects = rects_background if component in self.__components_background else rects_dirty
+                if component.rect_drawn is not None:
+                    rects.append(component.rect_drawn)  # Clear where it was
+                if component.visible:
+                    rects.append(component.rect_get())
+        if len(rects_background) > 0 and self.layer_background_render():
+            rects_dirty.extend(rects_background)
+        if len(rects_dirty) == 0:
+            self.components_drawn()
+            return
+        rects_dirty = rects_merge(rects_dirty)
+        for rect in rects_dirty:
+            self.surface.blit(self.layer_background, rect, rect)
+            self.surface.set_clip(rect)
+            for key, value in self.components.items():
+                if value.visible and value not in self.__components_background and value.rect_get().colliderect(rect):
+                    value.draw()
+        self.surface.set_clip(None)
+        self.components_drawn()
+        pygame.display.update(rects_dirty)
+        self.frame_drawn = True
+
+    def components_drawn(self):
+        """ Registers all widgets as drawn where they are now. """
+        for component in self.components.values():
+            component.dirty = False
+            component.rect_drawn = component.rect_get() if component.visible else None
+
+    async def update(self):
         pass
 
+    def screen_open(self, screen):
+        """ Opens a screen over this one, which is shown once the current frame is done. This screen continues
+            when it's closed.
+
+            :param screen: The screen to show
+        """
+        self.screen_next = screen
+
     def close(self):
         if self.parent_screen is not None:
             self.parent_screen.active = True
@@ -214,19 +302,47 @@ class Screen(object):
         self.loop_active = False
 
     async def loop(self):
-        """ Loops for events """
+        """ Loops for events, updating the screen :py:const:FRAME_RATE times a second. While nothing changes on
+            screen it slows down to :py:const:FRAME_RATE_IDLE. Between frames the loop sleeps, so other tasks
+            can run; frames that can't be finished in time are skipped.
+        """
+        event_loop = asyncio.get_running_loop()
+        frame_deadline = event_loop.time()
+        report_start = frame_deadline
+        report_frames = 0
         while self.loop_active:
-            pygame.time.wait(PYGAME_EVENT_DELAY)
-            task_update = asyncio.create_task(self.update())
-            await task_update
+            self.frame_drawn = False
+            await self.update()
             for event in pygame.event.get():  # Do for all events in pygame's event queue
                 if event.type == KEYDOWN:
                     if event.key == K_ESCAPE:
                         pygame.quit()
+                    else:
+                        self.on_key(event)
+                elif event.type in (MOUSEBUTTONDOWN, MOUSEBUTTONUP):
+                    self.process_mouse_event(event)
+            if self.screen_next is not None:  # Shows the screen opened, then continues with this one
+                screen, self.screen_next = self.screen_next, None
+                await screen.show()
+                self.draw_full()
+            report_frames += 1
+            frame_period = 1 / (FRAME_RATE if self.frame_drawn else FRAME_RATE_IDLE)
+            frame_deadline += frame_period
+            time_now = event_loop.time()
+            if time_now > frame_deadline:  # Running late, skip the frames that were missed
+                self.frames_skipped += int((time_now - frame_deadline) / frame_period)
+                frame_deadline = time_now
+            if time_now - report_start >= FRAME_RATE_REPORT_PERIOD:
+                self.frame_rate = report_frames / (time_now - report_start)
+                logging.info("Screen updated %.1f times per second, %d frames skipped", self.frame_rate,
+                             self.frames_skipped)
+                report_start = time_now
+                report_frames = 0
+            await asyncio.sleep(frame_deadline - time_now)
 
     def process_mouse_event(self, event):
         """ Processes mouse events. """
-        if event.type != pygame.MOUSEBUTTONDOWN and event.type != pygame.MOUSEBUTTONDOWN:
+        if event.type != pygame.MOUSEBUTTONDOWN and event.type != pygame.MOUSEBUTTONUP:
             return None
         gesture = self.gesture_detect.capture_gesture(event)
         x = self.gesture_detect.x_start
@@ -234,8 +350,8 @@ class Screen(object):
 
         if gesture == GESTURE_CLICK:  # Fire click function
             return self.on_click(x, y)  # Relay tap/click to active screen
-        # Relay vertical swiping to active screen controls
-        elif gesture == GESTURE_SWIPE_UP or gesture == GESTURE_SWIPE_DOWN:
+        # Relay swiping to active screen controls
+        elif gesture in (GESTURE_SWIPE_UP, GESTURE_SWIPE_DOWN, GESTURE_SWIPE_LEFT, GESTURE_SWIPE_RIGHT):
             x = self.gesture_detect.x_start
             y = self.gesture_detect.y_start
             self.on_swipe(x, y, gesture)
@@ -261,6 +377,13 @@ class Screen(object):
                     component.on_click(x, y)
                     return key
 
+    def on_key(self, event):
+        """ Handles a key being pressed.
+
+            :param event: pygame's KEYDOWN event
+        """
+        pass
+
     def on_swipe(self, x, y, swipe_type):
         """ Relays swipe to ItemList components for next(up)/previous(down) swipes for ItemLists.
 
@@ -363,7 +486,7 @@ class ScreenMessage(ScreenModal):
         y = self.window_y + 30
         width = self.window_width - x - 5
         height = self.window_height - y - 32
-        self.add_component(Memo('memo_text', self.surface, x, y, width, height, text))
+        self.add_component(Memo('memo_text', self.surface, (x, y), (width, height), text))
         self.add_component(ButtonText('btn_ok', self.surface, self.window_x + self.window_width - 60,
                                       self.window_y + self.window_height - 37, 55, 32, "OK"))
         self.components['btn_ok'].button_color = CREAM
@@ -394,7 +517,8 @@ class ScreenYesNo(ScreenModal):
         self.title_color = CREAM
         width = self.window_width - 58
         height = self.window_height - self.window_y - 32
-        self.add_component(Memo('memo_text', self.surface, self.window_x + 55, self.window_y + 32, width, height, text))
+        self.add_component(Memo('memo_text', self.surface, (self.window_x + 55, self.window_y + 32), (width, height),
+                                text))
         self.add_component(ButtonText('btn_yes', self.surface, self.window_x + self.window_width - 60,
                                       self.window_y + self.window_height - 37, 55, 32, "Yes"))
         self.components['btn_yes'].button_color = CREAM
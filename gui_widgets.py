@@ -23,6 +23,8 @@
 
 __author__ = 'Mark Zwart'
 
+from collections import OrderedDict
+
 from pygame.locals import *
 import math
 from settings import *
@@ -36,6 +38,122 @@ VERT_TOP = 0
 VERT_MID = 1
 VERT_BOTTOM = 2
 
+TEXT_CACHE_SIZE = 256  # Number of rendered texts kept
+text_cache = OrderedDict()  # Rendered texts by text, font, color and width, least recently used first
+glyph_advances = {}  # Advance widths of characters by font
+
+
+def text_fit(text, font, width):
+    """ Finds the longest beginning of a text fitting a width with a binary search.
+
+        :param text: The text
+        :param font: The font the text is rendered in
+        :param width: The available width in pixels
+        :return: The beginning of the text that fits
+    """
+    if font.size(text)[0] <= width:
+        return text
+    fits, overflows = 0, len(text)
+    while overflows - fits > 1:
+        middle = (fits + overflows) // 2
+        if font.size(text[:middle])[0] <= width:
+            fits = middle
+        else:
+            overflows = middle
+    return text[:fits]
+
+
+def text_render(text, font, color, width=None):
+    """ Renders text fitted to a width. Renders are shared by all widgets and cached, so unchanged text
+        isn't fitted or rendered again.
+
+        :param text: The text
+        :param font: The font the text is rendered in
+        :param color: The text color
+        :param width: The available width in pixels, None when the text doesn't need to fit
+        :return: Tuple of the text that fits and the surface it's rendered on
+    """
+    key = (text, font, tuple(color), width)
+    rendered = text_cache.get(key)
+    if rendered is not None:
+        text_cache.move_to_end(key)
+        return rendered
+    text_fitted = text if width is None else text_fit(text, font, width)
+    rendered = (text_fitted, font.render(text_fitted, True, color))
+    text_cache[key] = rendered
+    if len(text_cache) > TEXT_CACHE_SIZE:
+        text_cache.popitem(last=False)
+    return rendered
+
+
+def text_advances(text, font):
+    """ Looks up the advance width of each character of a text, measuring characters only the first time
+        they're used in a font.
+
+        :param text: The text
+        :param font: The font the text is rendered in
+        :return: List of advance widths in pixels
+    """
+    advances = glyph_advances.setdefault(font, {})
+    characters_new = ''.join(set(text).difference(advances))
+    if characters_new:
+        for character, metrics in zip(characters_new, font.metrics(characters_new)):
+            advances[character] = metrics[4] if metrics is not None else 0
+    return [advances[character] for character in text]
+
+
+def text_wrap(text, font, width):
+    """ Wraps text into lines fitting a width, in time linear to the text's length. Lines are broken at
+        spaces and words that don't fit a line by themselves are broken where they reach its end.
+
+        :param text: The text, lines are also broken at its newlines
+        :param font: The font the text is rendered in
+        :param width: The width of the lines in pixels
+        :return: List of lines
+    """
+    lines = []
+    space_width = text_advances(' ', font)[0]
+    for paragraph in text.split('\n'):
+        words = []
+        line_width = 0
+        for word in paragraph.split():
+            advances = text_advances(word, font)
+            word_width = sum(advances)
+            if words and line_width + space_width + word_width <= width:
+                words.append(word)
+                line_width += space_width + word_width
+                continue
+            if words:
+                lines.append(' '.join(words))
+            start = 0
+            line_width = 0
+            for index, advance in enumerate(advances):
+                if line_width + advance > width and index > start:
+                    lines.append(word[start:index])
+                    start = index
+                    line_width = 0
+                line_width += advance
+            words = [word[start:]]
+        lines.append(' '.join(words))
+    return lines
+
+
+def rects_merge(rects):
+    """ Merges overlapping rectangles, so no area is in more than one rectangle.
+
+        :param rects: List of rectangles
+        :return: List of non-overlapping rectangles covering the same area
+    """
+    merged = []
+    for rect in rects:
+        rect = Rect(rect)
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
 
 class Widget(object):
     """ Widget is the base class of screen widgets and should not be instantiated by itself.
@@ -63,11 +181,33 @@ class Widget(object):
         self.font = FONT
         self.font_color = CREAM
         self.font_height = self.font.size('Tg')[1]
+        self.dirty = True  # Whether the widget changed since it was last drawn by the screen
+        self.rect_drawn = None  # The rectangle the widget was last drawn in by the screen
+        self.version = 0  # Number of times the widget changed
 
     def on_click(self, x, y):
         """ The function called when a widget is clicked """
         return self.name
 
+    def dirty_set(self):
+        """ Marks the widget to be drawn again at the screen's next redraw. """
+        self.dirty = True
+        self.version += 1
+
+    def layer_state(self):
+        """ :return: A value that only changes when the widget looks different, used to cache the screen layer
+            the widget is drawn on.
+        """
+        return self.version
+
+    def animate(self):
+        """ Called by the screen every frame, so moving widgets can mark themselves to be drawn again. """
+        pass
+
+    def rect_get(self):
+        """ :return: The widget's rectangle on the screen. """
+        return Rect(self.x_pos, self.y_pos, self.width, self.height)
+
     def set_font(self, font_name, font_size, font_color=CREAM):
         self.font = pygame.font.Font(font_name, font_size)
         self.font_color = font_color
@@ -230,10 +370,11 @@ class Slider2(Widget):
         if percentage == 0:
             width = 1
         else:
-            width = self.width * (float(percentage) / 100)
-        self.progress_surface = pygame.Surface((width, self.height))
+            width = int(self.width * (float(percentage) / 100))
         self.progress_percentage = percentage
-        self.draw()
+        if width != self.progress_surface.get_width():
+            self.progress_surface = pygame.Surface((width, self.height))
+            self.dirty_set()
 
     def on_click(self, x, y):
         """ Sets the percentage of the slide by clicking.
@@ -243,6 +384,27 @@ class Slider2(Widget):
         return self.name
 
 
+def colors_dominant(image, qty_colors=3):
+    """ Determines the dominant colors of an image.
+
+        :param image: PIL image
+        :param qty_colors: The maximum number of colors returned
+        :return: List of RGB tuples, most dominant first
+    """
+    # Reduce to palette
+    paletted = image.convert('P', palette=Image.ADAPTIVE)
+    # Find dominant colors
+    palette = paletted.getpalette()
+    color_counts = sorted(paletted.getcolors(), reverse=True)
+    qty_colors = min(qty_colors, len(color_counts))
+    colors = list()
+    for i in range(qty_colors):
+        palette_index = color_counts[i][1]
+        dominant_color = palette[palette_index * 3:palette_index * 3 + 3]
+        colors.append(tuple(dominant_color))
+    return colors
+
+
 class Picture(Widget):
     """ Picture on screen
 
@@ -252,11 +414,23 @@ class Picture(Widget):
         :param y: The vertical starting position of the picture's rectangle
         :param width: The width of the picture's rectangle
         :param height: The height of the picture's rectangle
+
+        :ivar zoom_max: The maximum number of pixels the picture is widened when zooming, default = 0
+        :ivar zoom_step: The number of pixels between pre-scaled zoom levels, default = 8
     """
 
     def __init__(self, name, surface, surface_pos, widget_dims, image_file=""):
         Widget.__init__(self, name, surface, surface_pos, widget_dims)
-        self.picture_set(image_file)
+        self.__image_file = image_file
+        self.__image_source = pygame.Surface(widget_dims)  # Picture as set, before scaling
+        self.__image = self.__image_source
+        self.zoom_max = 0
+        self.zoom_step = 8
+        self.__zoom_stack = None  # Picture pre-scaled for each zoom level
+        self.__zoom_index = None  # Zoom level showing
+        self.__picture_version = 0  # Number of times the picture was set
+        if image_file != "":
+            self.picture_set(image_file)
 
     def draw(self):
         self.surface.fill((0, 0, 0))
@@ -269,34 +443,71 @@ class Picture(Widget):
     def picture_set(self, file_name):
         """ Sets the filename of the picture. """
         self.__image_file = file_name
-        self.__image = pygame.image.load(self.__image_file)
-        self.__image = pygame.transform.smoothscale(self.__image, (self.width, self.height))
-        self.draw()
+        self.picture_surface_set(pygame.image.load(self.__image_file))
+
+    def picture_surface_set(self, image):
+        """ Sets the picture from an already decoded surface, which is only scaled when it doesn't fit the widget.
+
+            :param image: pygame surface with the picture
+        """
+        self.__image_source = image
+        if image.get_size() != (self.width, self.height):
+            image = pygame.transform.smoothscale(image, (self.width, self.height))
+        self.__image = image
+        self.__zoom_stack = None
+        self.__zoom_index = None
+        self.__picture_version += 1
+        self.dirty_set()
 
     def picture_filename_get(self):
         return self.__image_file
 
     def position_size_set(self, x, y, width, height):
-        self.__image = pygame.image.load(self.__image_file)
-        self.__image = pygame.transform.scale(self.__image, (width, height))
+        self.__image = pygame.transform.scale(self.__image_source, (width, height))
         self.__image = self.__image.subsurface(x, y, width -x, height-y)
-        self.draw()
+        self.__picture_version += 1
+        self.dirty_set()
+
+    def layer_state(self):
+        """ :return: The picture and zoom level showing, so each zoom level's layer can be cached. """
+        return self.__picture_version, self.__zoom_index
+
+    def zoom_stack_create(self, image):
+        """ Scales a picture once for every zoom level. Doesn't change the widget, so it can be
+            called outside the event loop.
+
+            :param image: pygame surface with the picture
+            :return: List of surfaces, one for each zoom level
+        """
+        return [pygame.transform.smoothscale(image, (self.width + zoom, self.height)).convert()
+                for zoom in range(0, self.zoom_max + 1, self.zoom_step)]
+
+    def zoom_stack_set(self, zoom_stack):
+        """ Sets the pre-scaled zoom levels of the picture, created with zoom_stack_create. """
+        self.__zoom_stack = zoom_stack
+        self.__zoom_index = None
+
+    def zoom_set(self, zoom):
+        """ Widens the picture around its horizontal center by showing the nearest pre-scaled zoom level,
+            which costs a subsurface instead of a scale.
+
+            :param zoom: The number of pixels the picture is widened
+        """
+        if not self.__zoom_stack:
+            return
+        index = max(0, min(int(round(zoom / self.zoom_step)), len(self.__zoom_stack) - 1))
+        if index == self.__zoom_index:
+            return
+        self.__zoom_index = index
+        image = self.__zoom_stack[index]
+        x_offset = (image.get_width() - self.width) // 2
+        self.__image = image.subsurface((x_offset, 0, self.width, self.height))
+        self.dirty_set()
 
     def color_main(self, qty_colors=3):
-        image = Image.open(self.__image_file)
+        image = Image.frombytes('RGB', self.__image.get_size(), pygame.image.tostring(self.__image, 'RGB'))
         image = image.crop((0, self.height - 30, self.width, self.height))
-        # Reduce to palette
-        paletted = image.convert('P', palette=Image.ADAPTIVE)
-        # Find dominant colors
-        palette = paletted.getpalette()
-        color_counts = sorted(paletted.getcolors(), reverse=True)
-        qty_colors = min(qty_colors, len(color_counts))
-        colors = list()
-        for i in range(qty_colors):
-            palette_index = color_counts[i][1]
-            dominant_color = palette[palette_index * 3:palette_index * 3 + 3]
-            colors.append(tuple(dominant_color))
-        return colors
+        return colors_dominant(image, qty_colors)
 
 
 class LabelText(Widget):
@@ -309,6 +520,10 @@ class LabelText(Widget):
         :param width: The width of the label's rectangle
         :param height: The height of the label's rectangle
         :param text: The text to be displayed in the label, default= ""
+
+        :ivar scroll: Whether a caption that doesn't fit scrolls through the label, default = False
+        :ivar scroll_speed: The scrolling speed in pixels per second, default = 40
+        :ivar scroll_gap: The space in pixels between the end of the scrolling caption and its repeat, default = 80
     """
 
     def __init__(self, name, surface, surface_pos, widget_dims, text="", alignment=(HOR_LEFT, VERT_MID)):
@@ -319,6 +534,13 @@ class LabelText(Widget):
         self.indent_vertical = 0
         self.outline_color = BLACK
         self.background_alpha = 255
+        self.__composed_key = None  # What the label's surface was last composed of
+        self.scroll = False
+        self.scroll_speed = 40
+        self.scroll_gap = 80
+        self.__scroll_strip = None  # Background and full caption, moved through the label when scrolling
+        self.__scroll_key = None  # What the scroll strip was composed of
+        self.__scroll_start = 0  # Time the caption started scrolling (ms)
 
     def transparent_set(self, value):
         """ Turns background transparent or opaque. """
@@ -330,6 +552,7 @@ class LabelText(Widget):
     def background_alpha_set(self, value):
         if -1 < value < 256:
             self.background_alpha = value
+            self.dirty_set()
 
     def set_alignment(self, horizontal, vertical, hor_indent=0, vert_indent=0):
         """ Sets the label's horizontal and vertical alignment within the defined
@@ -344,44 +567,91 @@ class LabelText(Widget):
         self.alignment_vertical = vertical
         self.indent_horizontal = hor_indent
         self.indent_vertical = vert_indent
+        self.dirty_set()
 
     def text_set(self, text):
         if self.caption != text:
             self.caption = text
-            self.draw()
+            self.__scroll_start = pygame.time.get_ticks()
+            self.dirty_set()
+
+    def scroll_set(self, value):
+        """ Turns scrolling of captions that don't fit the label on or off. """
+        self.scroll = value
+        self.__scroll_start = pygame.time.get_ticks()
+        self.dirty_set()
+
+    def is_scrolling(self):
+        """ :return: Boolean indicating whether the caption scrolls through the label. """
+        return self.scroll and text_render(self.caption, self.font, self.font_color)[1].get_width() > self.width
+
+    def animate(self):
+        if self.is_scrolling():
+            self.dirty_set()
 
     def adjust_to_caption_size(self):
-        self.width = self.font.size(self.caption)[0]
+        self.width = min(self.font.size(self.caption)[0], self.screen.get_width())
         if self.alignment_horizontal == HOR_RIGHT:
-            test = self.screen.get_size()
             self.x_pos = self.screen.get_size()[0] - self.width
         self.surface = pygame.Surface((self.width, self.height))
-        self.draw()
+        self.dirty_set()
         return self.font.size(self.caption)[0]
 
     def draw(self):
-        """ Draws the label.
+        """ Draws the label, composing it again only when it changed.
 
             :return: Text that couldn't be fitted inside the label's rectangle,
         """
+        surface_rect = self.surface.get_rect()
+        if self.is_scrolling():
+            self.__draw_scrolling(surface_rect)
+            return ""
+        text_fitted, image = text_render(self.caption, self.font, self.font_color, surface_rect.width)
+        key = (self.surface, text_fitted, image, tuple(self.background_color), self.background_alpha,
+               self.alignment_horizontal, self.alignment_vertical, self.indent_horizontal, self.indent_vertical)
+        if key != self.__composed_key:
+            self.__compose(surface_rect, image)
+            self.__composed_key = key
+        self.screen.blit(self.surface, (self.x_pos, self.y_pos))
+        return self.caption[len(text_fitted):]
+
+    def __draw_scrolling(self, surface_rect):
+        """ Draws the scrolling caption by blitting the pre-rendered scroll strip at the caption's current
+            offset, followed by its repeat, so no text is rendered while scrolling.
+        """
+        text, image = text_render(self.caption, self.font, self.font_color)
+        key = (self.surface, text, image, tuple(self.background_color), self.background_alpha, self.alignment_vertical,
+               self.indent_vertical, surface_rect.height, self.scroll_gap)
+        if key != self.__scroll_key:
+            self.__scroll_strip = pygame.Surface((image.get_width() + self.scroll_gap, surface_rect.height)).convert()
+            self.__scroll_strip.fill(self.background_color)
+            self.__compose_caption(self.__scroll_strip, self.__scroll_strip.get_rect(), image, HOR_LEFT, 0)
+            self.surface.set_alpha(self.background_alpha)
+            self.__scroll_key = key
+            self.__composed_key = None
+        strip_width = self.__scroll_strip.get_width()
+        offset = int((pygame.time.get_ticks() - self.__scroll_start) * self.scroll_speed / 1000) % strip_width
+        self.surface.blit(self.__scroll_strip, (-offset, 0))
+        self.surface.blit(self.__scroll_strip, (strip_width - offset, 0))
+        self.screen.blit(self.surface, (self.x_pos, self.y_pos))
+
+    def __compose(self, surface_rect, image):
+        """ Draws the label's background and rendered caption on the label's surface. """
         # Draw background
         self.surface.set_alpha(self.background_alpha)
         self.surface.fill(self.background_color)
-        # Determining caption width and height
-        surface_rect = self.surface.get_rect()
-        i = 1
-        while self.font.size(self.caption[:i])[0] < surface_rect.width and i < len(
-                self.caption):  # Determine maximum width of line
-            i += 1
-        caption_width = self.font.size(self.caption[:i])[0]
-        caption_height = self.font.size(self.caption[:i])[1]
+        self.__compose_caption(self.surface, surface_rect, image, self.alignment_horizontal, self.indent_horizontal)
+
+    def __compose_caption(self, surface, surface_rect, image, alignment_horizontal, indent_horizontal):
+        """ Draws the rendered caption aligned on a surface. """
+        caption_width, caption_height = image.get_size()
         # Horizontal alignment
-        if self.alignment_horizontal == HOR_LEFT:
-            x = surface_rect.left + self.indent_horizontal
-        elif self.alignment_horizontal == HOR_MID:
-            x = surface_rect.centerx + self.indent_horizontal - caption_width / 2
-        elif self.alignment_horizontal == HOR_RIGHT:
-            x = surface_rect.right - self.indent_horizontal - caption_width
+        if alignment_horizontal == HOR_LEFT:
+            x = surface_rect.left + indent_horizontal
+        elif alignment_horizontal == HOR_MID:
+            x = surface_rect.centerx + indent_horizontal - caption_width / 2
+        elif alignment_horizontal == HOR_RIGHT:
+            x = surface_rect.right - indent_horizontal - caption_width
         # Vertical alignment
         if self.alignment_vertical == VERT_TOP:
             y = surface_rect.top + self.indent_vertical
@@ -390,14 +660,11 @@ class LabelText(Widget):
         elif self.alignment_vertical == VERT_BOTTOM:
             y = surface_rect.bottom - self.indent_vertical - caption_height
         # Draw Caption
-        image = FONT.render(self.caption[:i], True, self.font_color)
-        self.surface.blit(image, (x, y))
-        self.screen.blit(self.surface, (self.x_pos, self.y_pos))
-        return self.caption[i:]
+        surface.blit(image, (x, y))
 
 
 class Memo(Widget):
-    """ LabelText is used to write text that needs to fit in a pre-defined rectangle.
+    """ Memo is used to write text wrapped over lines within a pre-defined rectangle.
 
         :param name: Text identifying the memo field
         :param surface: The screen's rectangle where the memo field is drawn on
@@ -410,17 +677,23 @@ class Memo(Widget):
 
     def __init__(self, name, surface, surface_pos, widget_dims, text=""):
         Widget.__init__(self, name, surface, surface_pos, widget_dims)
-        self.__caption = text.decode('utf-8')
+        self.__caption = text
         self.__caption_lines = []
+        self.__wrap_key = None  # Caption, font and width the caption lines were wrapped for
         self.alignment_horizontal = HOR_LEFT
         self.indent_horizontal = 0
         self.outline_show = False
         self.outline_color = BLACK
         self.background_alpha = 255
 
+    def text_set(self, text):
+        if self.__caption != text:
+            self.__caption = text
+            self.dirty_set()
+
     def draw(self, text=None):
         if text is not None:
-            self.__caption = self.text.decode('utf-8')
+            self.text_set(text)
         # Draw background
         background = pygame.Surface((self.width, self.height))
         background.set_alpha(self.background_alpha)
@@ -428,18 +701,19 @@ class Memo(Widget):
         self.screen.blit(background, (self.x_pos, self.y_pos))
         # Draw outline
         if self.outline_show:
-            pygame.draw.rect(self.screen, self.outline_color, self.rect, 1)
+            pygame.draw.rect(self.screen, self.outline_color, self.rect_get(), 1)
         # Draw text lines
-        self.__wrap_caption()
-        line_height = self.font.size("jP")[1]
-        max_lines = self.height / (line_height + 2)
-        line_no = 0
-        for line in self.__caption_lines:
-            image = FONT.render(line, True, self.font_color)
-            self.screen.blit(image, (self.x_pos, self.y_pos + (line_no * line_height)))
-            line_no += 1
-            if line_no > max_lines:
-                break
+        line_height = self.font.get_linesize()
+        max_lines = self.height // line_height
+        for line_no, line in enumerate(self.__wrap_caption()[:max_lines]):
+            image = text_render(line, self.font, self.font_color)[1]
+            if self.alignment_horizontal == HOR_MID:
+                x = self.x_pos + (self.width - image.get_width()) / 2 + self.indent_horizontal
+            elif self.alignment_horizontal == HOR_RIGHT:
+                x = self.x_pos + self.width - image.get_width() - self.indent_horizontal
+            else:
+                x = self.x_pos + self.indent_horizontal
+            self.screen.blit(image, (x, self.y_pos + (line_no * line_height)))
 
     def transparent_set(self, value):
         """ Turns background transparent or opaque. """
@@ -452,33 +726,15 @@ class Memo(Widget):
         """ Sets the horizontal alignment of the lines. """
         self.alignment_horizontal = horizontal
         self.indent_horizontal = hor_indent
-
-    def __truncate_line(self):
-        split_text = self.__caption
-        label_width = self.font.size(self.__caption)[0]
-        cut = 0
-        a = 0
-        done = True
-        while label_width > self.width:
-            a += 1
-            n = self.__caption.rsplit(None, a)[0]
-            if split_text == n:
-                cut += 1
-                split_text = n[:-cut]
-            else:
-                split_text = n
-            label_width = self.font.size(split_text)[0]
-            done = False
-        return done, split_text
+        self.dirty_set()
 
     def __wrap_caption(self):
-        done = False
-        self.caption_lines = []
-        while not done:
-            done, split_text = self.__truncate_line()
-            self.__caption_lines.append(split_text.strip())
-            self.__caption = self.__caption[len(split_text):]
-            pass
+        """ :return: The caption's lines, only wrapped again when the caption, font or width changed. """
+        key = (self.__caption, self.font, self.width - self.indent_horizontal)
+        if key != self.__wrap_key:
+            self.__caption_lines = text_wrap(self.__caption, self.font, self.width - self.indent_horizontal)
+            self.__wrap_key = key
+        return self.__caption_lines
 
 
 class ButtonIcon(Widget):
@@ -607,8 +863,36 @@ class Switch(Widget):
         pygame.display.update(rect)
 
 
+class ItemSource(object):
+    """ Items for an ItemList that are only fetched when they're shown, for lists too long to keep in memory.
+        Behaves like a list for its length, indexing and slicing.
+
+        :param length_get: Function returning the number of items
+        :param items_get: Function returning a list of the items from a start index up to an end index
+    """
+
+    def __init__(self, length_get, items_get):
+        self.length_get = length_get
+        self.items_get = items_get
+
+    def __len__(self):
+        return self.length_get()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, end, step = index.indices(len(self))
+            return self.items_get(start, end)
+        if index < 0:
+            index += len(self)
+        items = self.items_get(index, index + 1)
+        if len(items) == 0:
+            raise IndexError('item index out of range')
+        return items[0]
+
+
 class ItemList(Widget):
-    """ List of text items that can be clicked.
+    """ List of text items that can be clicked. Only the items showing are fetched from the list and they're
+        drawn by a fixed pool of rows, which only render their text again when it changes.
 
         :param name: Text identifying the list
         :param surface: The screen's rectangle where the list is drawn on
@@ -617,7 +901,7 @@ class ItemList(Widget):
         :param width: The width of the list's rectangle
         :param height: The height of the list's rectangle
 
-        :ivar list: List containing items for ItemList
+        :ivar list: List or ItemSource containing items for ItemList
         :ivar outline_visible: Indicates whether the outline of the list is visible, default = True
 
         :ivar item_height: The height of one list item, default = 25
@@ -654,23 +938,32 @@ class ItemList(Widget):
         self.item_selected_color = BLUE
         self.item_selected_background_color = WHITE
 
-        self.items_per_page = (self.height - 2 * self.item_indent) / self.item_height  # Maximum number
+        self.items_per_page = (self.height - 2 * self.item_indent) // self.item_height  # Maximum number
         self.page_showing_index = 0  # Index of page currently showing
+        self.__rows = []  # Labels drawing the items showing
+
+    def list_set(self, items):
+        """ Sets the items of the list.
+
+            :param items: List or ItemSource with the items
+        """
+        self.list = items
+        self.page_showing_index = 0
+        self.dirty_set()
 
     def set_item_alignment(self, horizontal, vertical):
         """ Sets the alignment of the text of an item within the item's rectangle. """
         self.item_alignment_horizontal = horizontal
         self.item_alignment_vertical = vertical
+        self.dirty_set()
 
     def draw(self):
         """ Draws the item list on screen. """
-        self.screen.fill(self.background_color, self.rect)
+        self.screen.fill(self.background_color, self.rect_get())
         if self.outline_visible:
-            pygame.draw.rect(self.screen, self.outline_color, self.rect, 1)
-        pygame.display.update(self.rect)
+            pygame.draw.rect(self.screen, self.outline_color, self.rect_get(), 1)
         self.draw_items()
         self.draw_page_indicator()
-        pygame.display.flip()
 
     def draw_page_indicator(self):
         """ Draws a 'progress' indicator on the list. """
@@ -682,28 +975,45 @@ class ItemList(Widget):
             indicator = Rect(indicator_x, indicator_y, indicator_width, indicator_height)
             pygame.draw.rect(self.screen, CREAM, indicator)
 
+    def __rows_get(self):
+        """ :return: The pool of labels drawing the items, created again when the item height changed. """
+        self.items_per_page = (self.height - 2 * self.item_indent) // self.item_height
+        if len(self.__rows) != self.items_per_page or \
+                (len(self.__rows) > 0 and self.__rows[0].height != self.item_height):
+            item_width = self.width - 2 * self.item_indent - 10  # Maximum item width
+            self.__rows = [LabelText('lbl_item_' + str(row_nr), self.screen,
+                                     (self.x_pos + self.item_indent,
+                                      self.y_pos + self.item_indent + self.item_height * row_nr),
+                                     (item_width, self.item_height))
+                           for row_nr in range(self.items_per_page)]
+        return self.__rows
+
     def draw_items(self):
-        """ Draws the list items. """
+        """ Draws the list items showing. """
         # Do not draw items when there are none
         if self.list is None:
             return
-        # Populate the ItemList with items
-        item_nr = 0
+        rows = self.__rows_get()
         item_start = self.page_showing_index * self.items_per_page
-        while item_nr + item_start < len(self.list) and item_nr < self.items_per_page:
-            item_text = self.list[item_nr + item_start]  # Get item text from list
-            item_x_pos = self.x_pos + self.item_indent                                  # x position of item
-            item_width = self.width - 2 * self.item_indent - 10  # Maximum item width
-            item_y_pos = self.y_pos + self.item_indent + (self.item_height * item_nr)   # y position of item
-            list_item = LabelText('lbl_item_' + str(item_nr), self.screen, item_x_pos, item_y_pos, item_width,
-                                  self.item_height, item_text)  # Create label
-            list_item.font_color = self.font_color
-            list_item.outline_visible = self.item_outline_visible
-            if item_nr + item_start == self.active_item_index:  # Give active item designated colour
-                list_item.font_color = self.item_active_color
-            list_item.set_alignment(self.item_alignment_horizontal, self.item_alignment_vertical)
-            list_item.draw()  # Draw item on screen
-            item_nr += 1
+        items = self.list[item_start:item_start + len(rows)]  # Only fetches the items showing
+        for row, item_text in zip(rows, items):
+            row.screen = self.screen
+            row.text_set(item_text)
+            row.font = self.font
+            row.outline_visible = self.item_outline_visible
+            row.alignment_horizontal = self.item_alignment_horizontal
+            row.alignment_vertical = self.item_alignment_vertical
+            if item_start == self.item_selected_index:
+                row.font_color = self.item_selected_color
+                row.background_color = self.item_selected_background_color
+            elif item_start == self.active_item_index:  # Give active item designated colour
+                row.font_color = self.item_active_color
+                row.background_color = self.item_active_background_color
+            else:
+                row.font_color = self.font_color
+                row.background_color = self.background_color
+            row.draw()  # Only renders when the item's text or colors changed
+            item_start += 1
 
     def clicked_item(self, x_pos, y_pos):
         """ Determines which item, if any, was clicked.
@@ -718,18 +1028,18 @@ class ItemList(Widget):
         if x_pos < 0 or x_pos > self.width or y_pos < 0:  # Check whether the click was outside the control
             self.item_selected_index = -1
             return None
-        if y_pos > self.height or (
-                self.page_showing_index * self.items_per_page + (y_pos + 2)) / self.item_height >= len(
-                self.list):  # Check whether no item was clicked
+        item_index = self.page_showing_index * self.items_per_page + (y_pos - self.item_indent) // self.item_height
+        if y_pos > self.height or item_index >= len(self.list):  # Check whether no item was clicked
             self.item_selected_index = -1
             return None
-        self.item_selected_index = (self.page_showing_index * self.items_per_page + (y_pos + 2) / self.item_height)
+        self.item_selected_index = item_index
+        self.dirty_set()
         return self.item_selected_index
 
     def pages_count(self):
         """ :return: The number of pages filled with list items """
         items_count = len(self.list)
-        page_count = int(math.ceil(items_count / self.items_per_page) + 1)
+        page_count = int(math.ceil(items_count / max(self.items_per_page, 1)))
         return page_count
 
     def item_active_get(self):
@@ -737,9 +1047,9 @@ class ItemList(Widget):
         return self.list[self.active_item_index]
 
     def item_active_index_set(self, index):
-        if 0 <= index < len(list):
+        if 0 <= index < len(self.list):
             self.active_item_index = index
-            self.draw()
+            self.dirty_set()
 
     def item_selected_get(self):
         """ :return: selected item's text """
@@ -759,22 +1069,19 @@ class ItemList(Widget):
         """ Shows next page of items """
         if self.page_showing_index * self.items_per_page + self.items_per_page < len(self.list):
             self.page_showing_index += 1
-            self.draw()
+            self.dirty_set()
 
     def show_prev_items(self):
         """ Shows previous page of items """
         if self.page_showing_index * self.items_per_page > 0:
             self.page_showing_index -= 1
-            self.draw()
+            self.dirty_set()
         else:
             self.page_showing_index = 0
 
     def show_item_active(self):
-        page_no = 0
-        while self.active_item_index > (page_no + 1) * self.items_per_page:
-            page_no += 1
-        self.page_showing_index = page_no
-        self.draw()
+        self.page_showing_index = max(self.active_item_index, 0) // max(self.items_per_page, 1)
+        self.dirty_set()
 
 
 class WidgetContainer(Widget):
@@ -0,0 +1,102 @@
+# This file is part of pi-jukebox.
+#
+# pi-jukebox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-jukebox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pi-jukebox. If not, see < http://www.gnu.org/licenses/ >.
+#
+# (C) 2015- by Mark Zwart, <mark.zwart@pobox.com>
+"""
+=======================================================
+**library_search.py**: Fuzzy search through texts with a trigram index.
+=======================================================
+"""
+import math
+import unicodedata
+
+import numpy as np
+
+#: Fraction of a query's trigrams a text must contain to be found
+SEARCH_MATCH_MIN = 0.6
+#: Maximum number of texts with the most matching trigrams that are ranked in detail
+SEARCH_RANK_MAX = 1000
+
+
+def text_normalise(text):
+    """ :return: The text in lower case without accents, so matching ignores case and accents. """
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(character for character in text if not unicodedata.combining(character))
+
+
+def trigrams_get(text, partial=False):
+    """ Splits the words of a normalised text into trigrams. Words are padded with spaces, so their beginnings
+        and ends count and words shorter than three characters have trigrams too.
+
+        :param text: Normalised text
+        :param partial: Whether the last word is still being typed, so its end isn't padded
+        :return: Set of trigrams
+    """
+    trigrams = set()
+    words = text.split()
+    for word_no, word in enumerate(words):
+        word = ' ' + word if partial and word_no == len(words) - 1 else ' ' + word + ' '
+        for i in range(len(word) - 2):
+            trigrams.add(word[i:i + 3])
+    return trigrams
+
+
+class SearchIndex(object):
+    """ Trigram index over a list of texts. A search counts for each text how many of the query's trigrams it
+        contains, so texts are also found with typing errors or with words missing, and ranks them on the count.
+
+        :param texts: List of texts, searches return indexes into it
+
+        :ivar size: The number of texts
+    """
+
+    def __init__(self, texts):
+        self.__texts = [text_normalise(text) for text in texts]
+        self.size = len(self.__texts)
+        postings = {}
+        for index, text in enumerate(self.__texts):
+            for trigram in trigrams_get(text):
+                postings.setdefault(trigram, []).append(index)
+        self.__postings = {trigram: np.array(indexes, dtype=np.uint32) for trigram, indexes in postings.items()}
+
+    def search(self, query, limit=50):
+        """ Finds the texts best matching a query that's being typed.
+
+            :param query: The query, its last word is taken as still being typed unless followed by a space
+            :param limit: The maximum number of texts found
+            :return: List of indexes of the texts found, best match first
+        """
+        query = text_normalise(query)
+        trigrams = trigrams_get(query, partial=not query.endswith(' '))  # A space ends the last word
+        query = query.strip()
+        postings = [self.__postings[trigram] for trigram in trigrams if trigram in self.__postings]
+        if len(postings) == 0:
+            return []
+        counts = np.bincount(np.concatenate(postings), minlength=self.size)
+        candidates = np.flatnonzero(counts >= max(1, math.ceil(len(trigrams) * SEARCH_MATCH_MIN)))
+        if len(candidates) > SEARCH_RANK_MAX:  # Only ranks the candidates with the most trigrams in detail
+            candidates = candidates[np.argpartition(-counts[candidates], SEARCH_RANK_MAX)[:SEARCH_RANK_MAX]]
+        words = query.split()
+        ranked = sorted(candidates, key=lambda index: self.__rank_get(index, counts[index], words, len(trigrams)))
+        return [int(index) for index in ranked[:limit]]
+
+    def __rank_get(self, index, count, words, trigrams_count):
+        """ :return: Sort key of a text found, ranking texts with all words as word beginnings first, then texts
+            with the most matching trigrams and whole words, then shorter texts.
+        """
+        text = ' ' + self.__texts[index] + ' '
+        prefixes = all(' ' + word in text for word in words)
+        words_whole = sum(' ' + word + ' ' in text for word in words)
+        return -count - (trigrams_count if prefixes else 0), -words_whole, len(text)
@@ -1,6 +1,5 @@
 
 import asyncio
-import sys
 
 from settings import *
 from mpd_client import *
@@ -8,12 +7,12 @@ from screen_player import *
 
 
 async def main():
-    task_connect = asyncio.create_task(mpd.connect())
-    is_connected = await task_connect
-    if not is_connected:
-        print("Couldn't connect to the mpd server " + mpd.host + " on port " + str(
-            mpd.port) + "! Check settings in file pi-jukebox.conf or check is server is running 'systemctl status mpd'.")
-        sys.exit()
+    mpd.supervise()
+    mpd.subscribe()
+    if not await mpd.connection_wait(CONNECT_TIMEOUT):
+        logging.warning("Couldn't connect to the mpd server %s on port %d yet, retrying in the background. Check "
+                        "settings in file pi-jukebox.conf or check is server is running 'systemctl status mpd'.",
+                        mpd.host, mpd.port)
     pygame.init()
     screen_player = ScreenPlayer(SCREEN, name_sound_device=NAME_SOUND_DEVICE)
     await screen_player.show()
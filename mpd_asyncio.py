@@ -25,14 +25,14 @@ async def main_screen(stdscr):
         try:
             event = mpd.events.popleft()
             playing = mpd.now_playing
-            if event == 'time_elapsed':
-                stdscr.addstr(12, 10, "Time elapsed: " + str(playing.time_percentage))
-            if event == 'playing_file':
+            if event == EVENT_TIME_ELAPSED:
+                stdscr.addstr(12, 10, "Time elapsed: " + str(round(playing.time_percentage)))
+            if event == EVENT_PLAYING_FILE:
                 stdscr.addstr(14, 10, 'Title: ' + mpd.now_playing.title)
                 stdscr.addstr(15, 10, 'Artist: ' + mpd.now_playing.artist)
-            if event == 'album_change':
-                file_img_cover = await mpd.now_playing.get_cover_art()
-                stdscr.addstr(16, 10, 'Cover file: ' + file_img_cover)
+            if event == EVENT_ALBUM_CHANGE:
+                blob_cover = await mpd.now_playing.get_cover_art()
+                stdscr.addstr(16, 10, 'Cover size: ' + str(len(blob_cover or b'')) + ' bytes')
         except IndexError:
             pass
         amplitude = round(audio_spectrometer.listen())
@@ -19,13 +19,20 @@
 **mpd_client.py**: controlling and monitoring mpd via python-mpd2.
 ==================================================================
 """
+import contextlib
 import logging
 
 import os
+import random
+import sqlite3
 import time
 import asyncio
+from mpd import CommandError, ConnectionError as MPDConnectionError
 from mpd.asyncio import MPDClient
-from collections import deque
+from collections import deque, namedtuple, OrderedDict
+
+from library_search import SearchIndex
+from settings import *
 
 MPD_TYPE_ARTIST = 'artist'
 MPD_TYPE_ALBUM = 'album'
@@ -34,15 +41,80 @@ MPD_TYPE_SONGS = 'title'
 DEFAULT_COVER = 'default_cover_art.png'
 TEMP_PLAYLIST_NAME = '_pi-jukebox_temp'
 
+#: Subsystems the controller listens to when subscribed to mpd's idle notifications
+IDLE_SUBSYSTEMS = ['player', 'mixer', 'playlist', 'options', 'database']
+
+# Events pushed in the controller's event queue
+EVENT_PLAYING_FILE = 'playing_file'
+EVENT_ALBUM_CHANGE = 'album_change'
+EVENT_PLAYER_CONTROL = 'player_control'
+EVENT_TIME_ELAPSED = 'time_elapsed'
+EVENT_VOLUME = 'volume'
+EVENT_PLAYLIST = 'playlist'
+EVENT_OPTIONS = 'options'
+EVENT_NEXT_SONG = 'next_song'
+EVENT_QUEUE = 'queue'
+EVENT_LIBRARY = 'library'
+
+#: Number of songs the queue model fetches from mpd at once
+QUEUE_WINDOW_SIZE = 100
+#: Maximum number of queue windows the queue model keeps
+QUEUE_WINDOWS_MAX = 20
+
+#: Time allowed for connecting to mpd, for keepalive pings and for mpd to answer player commands (seconds)
+CONNECT_TIMEOUT = 5
+#: Wait before the first reconnection attempt, doubled after each failed attempt (milliseconds)
+RECONNECT_WAIT_MIN = 500
+#: Maximum wait between reconnection attempts (milliseconds)
+RECONNECT_WAIT_MAX = 30000
+#: Interval between pings checking the connection to mpd is alive (seconds)
+KEEPALIVE_INTERVAL = 20
+#: Errors indicating the connection to mpd failed or was lost
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError, MPDConnectionError)
+#: Maximum number of connections to mpd for commands and transfers, besides the one listening to idle notifications
+COMMAND_CONNECTIONS = 2
+#: Time after which an unused command connection is made again, before mpd closes it (seconds)
+COMMAND_CONNECTION_MAX_IDLE = 45
+
+#: Number of songs written to the library index at once while filling it
+LIBRARY_BATCH_SIZE = 1000
+
+#: Compact record of a song, used to detect song changes
+SongRecord = namedtuple('SongRecord', ['id', 'file', 'title', 'artist', 'album'])
+#: mpd's status with its current song and the song that plays next, as fetched together in one round trip
+StatusSnapshot = namedtuple('StatusSnapshot', ['status', 'current_song', 'next_song'])
 
-def retry(func, ex_type=Exception, limit=0, wait_ms=100, wait_increase_ratio=2, logger=None):
+
+def song_record_get(song):
+    """ :return: A SongRecord of mpd's song information, None for an empty song. """
+    if len(song) == 0:
+        return None
+    return SongRecord(id=song.get('id'),
+                      file=song.get('file', ''),
+                      title=tag_get(song, 'title'),
+                      artist=tag_get(song, 'artist'),
+                      album=tag_get(song, 'album') if 'album' in song else tag_get(song, 'name'))
+
+
+def tag_get(song, tag):
+    """ :return: The first value of a song's tag, mpd returns a list for tags with more than one value. """
+    value = song.get(tag, '')
+    if isinstance(value, list):
+        return value[0]
+    return value
+
+
+async def retry(func, ex_type=Exception, limit=0, wait_ms=100, wait_increase_ratio=2, wait_max_ms=30000, jitter=0.5,
+                logger=None):
     """
-    Retry a function invocation until no exception occurs
-    :param func: function to invoke
+    Retry a coroutine function invocation until no exception occurs, waiting without blocking the event loop
+    :param func: coroutine function to invoke
     :param ex_type: retry only if exception is subclass of this type
     :param limit: maximum number of invocation attempts
     :param wait_ms: initial wait time after each attempt in milliseconds.
     :param wait_increase_ratio: increase wait period by multiplying this value after each attempt.
+    :param wait_max_ms: maximum wait time after an attempt in milliseconds.
+    :param jitter: vary each wait randomly by this fraction, so clients don't retry in lockstep.
     :param logger: if not None, retry attempts will be logged to this logging.logger
     :return: result of first successful invocation
     :raises: last invocation exception if attempts exhausted or exception is not an instance of ex_type
@@ -50,7 +122,7 @@ def retry(func, ex_type=Exception, limit=0, wait_ms=100, wait_increase_ratio=2,
     attempt = 1
     while True:
         try:
-            return func()
+            return await func()
         except Exception as ex:
             if not isinstance(ex, ex_type):
                 raise ex
@@ -63,17 +135,86 @@ def retry(func, ex_type=Exception, limit=0, wait_ms=100, wait_increase_ratio=2,
                 logger.error("failed execution attempt #%d", attempt, exc_info=ex)
 
             attempt += 1
+            wait_jittered_ms = wait_ms * random.uniform(1 - jitter, 1 + jitter)
             if logger:
-                logger.info("waiting %d ms before attempt #%d", wait_ms, attempt)
-            time.sleep(wait_ms / 1000)
-            wait_ms *= wait_increase_ratio
+                logger.info("waiting %d ms before attempt #%d", wait_jittered_ms, attempt)
+            await asyncio.sleep(wait_jittered_ms / 1000)
+            wait_ms = min(wait_ms * wait_increase_ratio, wait_max_ms)
+
+
+class MPDConnectionPool(object):
+    """ Connections to mpd for commands and transfers, separate from the connection listening to idle
+        notifications and fetching the status. A connection is lent for one command or transfer at a time, and
+        transfers like albumart can't take the last connection, so commands never wait for a transfer.
+        Connections are made when they're first needed.
+
+        :param host: mpd's host name
+        :param port: mpd's port
+        :param size: The maximum number of connections, default = :py:const:COMMAND_CONNECTIONS
+    """
+
+    def __init__(self, host, port, size=COMMAND_CONNECTIONS):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.__connections_free = []  # Connected clients with the time they were last used
+        self.__semaphore = None  # Created when first used, as Python 3.7 binds it to the event loop running then
+        self.__semaphore_transfers = None
+
+    @contextlib.asynccontextmanager
+    async def connection(self, transfer=False):
+        """ Lends a connection, which is dropped when it fails.
+
+            :param transfer: Whether the connection is used for a transfer, default = False
+        """
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.size)
+            self.__semaphore_transfers = asyncio.Semaphore(max(self.size - 1, 1))
+        if transfer:
+            await self.__semaphore_transfers.acquire()
+        try:
+            async with self.__semaphore:
+                client = await self.__client_get()
+                try:
+                    yield client
+                except CommandError:  # mpd refused the command, the connection is fine
+                    self.__connections_free.append((client, time.monotonic()))
+                    raise
+                except BaseException:
+                    client.disconnect()
+                    raise
+                self.__connections_free.append((client, time.monotonic()))
+        finally:
+            if transfer:
+                self.__semaphore_transfers.release()
+
+    async def __client_get(self):
+        """ :return: A free connection, connecting a new client when there's none that's still open. """
+        while len(self.__connections_free) > 0:
+            client, time_used = self.__connections_free.pop()
+            if time.monotonic() - time_used < COMMAND_CONNECTION_MAX_IDLE:
+                return client
+            client.disconnect()
+        client = MPDClient()
+        try:
+            await asyncio.wait_for(client.connect(self.host, self.port), CONNECT_TIMEOUT)
+        except BaseException:
+            client.disconnect()
+            raise
+        return client
+
+    def close(self):
+        """ Closes the connections that aren't lent out. """
+        for client, time_used in self.__connections_free:
+            client.disconnect()
+        self.__connections_free = []
 
 
 class MPDNowPlaying(object):
     """ Song information
     """
-    def __init__(self, mpd_client):
-        self.__mpd_client = mpd_client
+    def __init__(self, mpd_commands):
+        self.__mpd_commands = mpd_commands
         self.playing_type = ''
         self.__now_playing = None
         self.title = ""  # Current playing song name
@@ -86,6 +227,10 @@ class MPDNowPlaying(object):
         self.time_total = ""  # Current playing song duration (string format)
         self.time_percentage = 0  # Current playing song time as a percentage of the song duration
         self.music_directory = ""
+        # Playback clock, extrapolates the playing time from the last mpd status
+        self.__clock_running = False  # Whether the song is playing since the last sync
+        self.__clock_sync_sec = 0  # Playing time at the last sync (seconds)
+        self.__clock_sync_time = time.monotonic()  # Monotonic time of the last sync (seconds)
 
     def now_playing_set(self, now_playing=None):
         if now_playing is not None:
@@ -100,24 +245,24 @@ class MPDNowPlaying(object):
                 self.playing_type = 'file'
 
             if 'title' in now_playing:
-                self.title = now_playing['title']  # Song title of current song
+                self.title = tag_get(now_playing, 'title')  # Song title of current song
             else:
                 self.title = os.path.splitext(os.path.basename(now_playing['file']))[0]
             if self.playing_type == 'file':
                 if 'artist' in now_playing:
-                    self.artist = now_playing['artist']  # Artist of current song
+                    self.artist = tag_get(now_playing, 'artist')  # Artist of current song
                 else:
                     self.artist = "Unknown"
                 if 'album' in now_playing:
-                    self.album = now_playing['album']  # Album the current song is on
+                    self.album = tag_get(now_playing, 'album')  # Album the current song is on
                 else:
                     self.album = "Unknown"
-                current_total = self.str_to_float(now_playing['time'])
+                current_total = self.str_to_float(now_playing.get('duration', now_playing.get('time', 0)))
                 self.__time_total_sec = current_total
                 self.time_total = self.make_time_string(current_total)  # Total time current
             elif self.playing_type == 'radio':
                 if 'name' in now_playing:
-                    self.album = now_playing['name']  # The radio station name
+                    self.album = tag_get(now_playing, 'name')  # The radio station name
                 else:
                     self.album = "Unknown"
                 self.artist = ""
@@ -130,41 +275,68 @@ class MPDNowPlaying(object):
             self.time_percentage = 0
             self.__time_total_sec = 0
             self.time_total = self.make_time_string(0)  # Total time current
+            self.clock_sync(0, 'stop')
         return True
 
     async def get_cover_binary(self, uri):
         try:
             logging.info("Start first try to get cover art from %s", uri)
-            cover = await self.__mpd_client.albumart(uri)
+            async with self.__mpd_commands.connection(transfer=True) as client:
+                cover = await client.albumart(uri)
             binary = cover['binary']
             logging.info("End first try to get cover art")
-        except:
+        except asyncio.CancelledError:
+            raise
+        except Exception:
             logging.warning("Could not retrieve album cover of %s", uri)
             binary = None
         return binary
 
     async def get_cover_art(self):
-        blob_cover = await self.get_cover_binary(self.file)
-        if blob_cover is None:
-            file_cover_art = "default_cover_art.png"
-        else:
-            with open('covert_art.img', 'wb') as img:
-                img.write(blob_cover)  # write artwork to new image
-            file_cover_art = "covert_art.img"
-        return file_cover_art
+        """ :return: The image bytes of the playing song's cover art, None when it has none. """
+        return await self.get_cover_binary(self.file)
 
     def current_time_set(self, seconds):
         if self.__time_current_sec != seconds:  # Playing time current
             self.__time_current_sec = seconds
             self.time_current = self.make_time_string(seconds)
-            if self.playing_type != 'radio':
-                self.time_percentage = int(self.__time_current_sec / self.__time_total_sec * 100)
+            if self.playing_type != 'radio' and self.__time_total_sec > 0:
+                self.time_percentage = self.__time_current_sec / self.__time_total_sec * 100
             else:
                 self.time_percentage = 0
             return True
         else:
             return False
 
+    def clock_sync(self, seconds, state):
+        """ Resynchronises the playback clock with the playing time and state reported by mpd.
+
+            :param seconds: Playing time of the current song (seconds)
+            :param state: Playback state ['play', 'pause', 'stop']
+            :return: Boolean indicating whether the playing time changed
+        """
+        self.__clock_running = state == 'play'
+        self.__clock_sync_sec = seconds
+        self.__clock_sync_time = time.monotonic()
+        return self.current_time_set(seconds)
+
+    def clock_get(self):
+        """ :return: The playing time, advanced by the playback clock (seconds). """
+        self.clock_tick()
+        return self.__time_current_sec
+
+    def clock_tick(self):
+        """ Advances the playing time by extrapolating from the last sync while the song is playing.
+
+            :return: Boolean indicating whether the playing time changed
+        """
+        if not self.__clock_running:
+            return False
+        seconds = self.__clock_sync_sec + time.monotonic() - self.__clock_sync_time
+        if self.__time_total_sec > 0:
+            seconds = min(seconds, self.__time_total_sec)
+        return self.current_time_set(seconds)
+
     def make_time_string(self, seconds):
         minutes = int(seconds / 60)
         seconds_left = int(round(seconds - (minutes * 60), 0))
@@ -184,43 +356,689 @@ class MPDNowPlaying(object):
             return float(0)
 
 
+class MPDQueue(object):
+    """ The songs in mpd's queue, fetched in windows of :py:const:QUEUE_WINDOW_SIZE songs when they're needed,
+        so a long queue is never fetched as a whole. When the playlist version changes only the changed songs
+        are looked up, and only the windows holding them are fetched again.
+
+        :param mpd_commands: MPDConnectionPool with connections to mpd
+        :param events: Event queue that gets :py:const:EVENT_QUEUE when songs are fetched or changed
+
+        :ivar length: The number of songs in the queue
+        :ivar version: The playlist version the queue is up to date with
+        :ivar position: The position of the current song in the queue, -1 when there is none
+    """
+
+    def __init__(self, mpd_commands, events):
+        self.mpd_commands = mpd_commands
+        self.events = events
+        self.length = 0
+        self.version = None
+        self.position = -1
+        self.__windows = OrderedDict()  # Lists of SongRecords by window index, least recently used first
+        self.__windows_loading = {}  # Tasks fetching windows by window index
+
+    def __len__(self):
+        return self.length
+
+    def songs_get(self, start, end):
+        """ Gets the songs of part of the queue, starting to fetch those that aren't there yet.
+
+            :param start: Position of the first song
+            :param end: Position after the last song
+            :return: List of SongRecords, None for songs that are still being fetched
+        """
+        end = min(end, self.length)
+        songs = [None] * max(end - start, 0)
+        for index in range(start // QUEUE_WINDOW_SIZE, (end + QUEUE_WINDOW_SIZE - 1) // QUEUE_WINDOW_SIZE):
+            window = self.__windows.get(index)
+            if window is None:
+                self.__window_load_start(index)
+                continue
+            self.__windows.move_to_end(index)
+            window_start = index * QUEUE_WINDOW_SIZE
+            for position in range(max(start, window_start), min(end, window_start + len(window))):
+                songs[position - start] = window[position - window_start]
+        return songs
+
+    def __window_load_start(self, index):
+        if index not in self.__windows_loading:
+            self.__windows_loading[index] = asyncio.create_task(self.__window_load(index))
+
+    async def __window_load(self, index):
+        """ Fetches the songs of a window with a playlistinfo range. """
+        version = self.version
+        start = index * QUEUE_WINDOW_SIZE
+        try:
+            async with self.mpd_commands.connection(transfer=True) as client:
+                songs = await client.playlistinfo('%d:%d' % (start, start + QUEUE_WINDOW_SIZE))
+        except Exception:
+            logging.exception("Could not fetch queue songs %d to %d", start, start + QUEUE_WINDOW_SIZE)
+            return
+        finally:
+            del self.__windows_loading[index]
+        if version == self.version:  # Otherwise the queue changed while fetching, it's fetched again when needed
+            self.__windows[index] = [song_record_get(song) for song in songs]
+            while len(self.__windows) > QUEUE_WINDOWS_MAX:
+                self.__windows.popitem(last=False)
+        self.events.append(EVENT_QUEUE)
+
+    async def update(self, status):
+        """ Brings the queue up to date with mpd's status. The songs changed since the previous playlist
+            version are looked up with plchangesposid, and only the fetched windows they're in are fetched again.
+
+            :param status: mpd's status output
+            :return: Boolean indicating whether the playlist version changed
+        """
+        self.position = int(status.get('song', -1))
+        version = status.get('playlist')
+        if version == self.version:
+            return False
+        length = int(status.get('playlistlength', 0))
+        if self.version is None or len(self.__windows) == 0:
+            self.__windows.clear()
+        else:
+            windows_changed = set()
+            async with self.mpd_commands.connection() as client:
+                changes = await client.plchangesposid(self.version)
+            for change in changes:
+                position = int(change['cpos'])
+                index = position // QUEUE_WINDOW_SIZE
+                window = self.__windows.get(index)
+                offset = position - index * QUEUE_WINDOW_SIZE
+                if window is not None and (offset >= len(window) or window[offset].id != change['id']):
+                    windows_changed.add(index)
+            for index in list(self.__windows):
+                window_start = index * QUEUE_WINDOW_SIZE
+                if index in windows_changed or window_start >= length:
+                    del self.__windows[index]
+                else:
+                    self.__windows[index] = self.__windows[index][:length - window_start]
+        # Only once the changes are applied, so a failed update is tried again
+        self.version = version
+        self.length = length
+        self.events.append(EVENT_QUEUE)
+        return True
+
+
+class MPDLibrary(object):
+    """ Local index of mpd's music database, so the library is browsed without asking mpd. The index is stored
+        in SQLite and filled from listallinfo, one top level directory at a time; it's only filled again when
+        mpd reports a different database update time. Filling it takes a while, so it's done on a connection of
+        its own, which never holds up commands or transfers like albumart.
+
+        :param mpd_commands: MPDConnectionPool with the library's own connection to mpd
+        :param file_name: The index's SQLite database file
+
+        :ivar search_index: SearchIndex over the songs' artist, album and title, None until it's built
+    """
+
+    def __init__(self, mpd_commands, file_name=LIBRARY_FILE):
+        self.mpd_commands = mpd_commands
+        self.file_name = file_name
+        self.search_index = None
+        self.__search_songs = []  # Rows of the songs in the search index
+        self.__db = None  # Connection to the index's database, opened when it's first used
+
+    def __db_get(self):
+        """ :return: The connection to the index's database, which is opened, and created, when first used. """
+        if self.__db is None:
+            os.makedirs(os.path.dirname(self.file_name), exist_ok=True)
+            self.__db = sqlite3.connect(self.file_name)
+            self.__db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.__songs_table_create('songs')
+            self.__songs_indexes_create()
+            self.__db.commit()
+        return self.__db
+
+    def __songs_table_create(self, table):
+        self.__db.execute("CREATE TABLE IF NOT EXISTS " + table + " (file TEXT PRIMARY KEY, "
+                        "artist TEXT COLLATE NOCASE, album TEXT COLLATE NOCASE, title TEXT, "
+                        "track INTEGER, duration REAL)")
+
+    def __songs_indexes_create(self):
+        self.__db.execute("CREATE INDEX IF NOT EXISTS songs_artist_album ON songs (artist, album, track)")
+        self.__db.execute("CREATE INDEX IF NOT EXISTS songs_album ON songs (album)")
+
+    def db_update_get(self):
+        """ :return: mpd's database update time the index was filled for, None when it wasn't filled yet. """
+        row = self.__db_get().execute("SELECT value FROM meta WHERE key = 'db_update'").fetchone()
+        return row[0] if row is not None else None
+
+    async def sync(self):
+        """ Fills the index again when mpd's database was updated since it was last filled.
+
+            :return: Boolean indicating whether the index was filled
+        """
+        async with self.mpd_commands.connection() as client:
+            stats = await client.stats()
+            db_update = stats.get('db_update')
+            if db_update == self.db_update_get():
+                return False
+            logging.info("Indexing mpd library")
+            self.__db.execute("DROP TABLE IF EXISTS songs_new")
+            self.__songs_table_create('songs_new')
+            songs = []
+            for entry in await client.lsinfo():
+                if 'file' in entry:
+                    songs.append(self.__song_row_get(entry))
+                elif 'directory' in entry:
+                    async for song in client.listallinfo(entry['directory']):
+                        if 'file' in song:
+                            songs.append(self.__song_row_get(song))
+                        if len(songs) >= LIBRARY_BATCH_SIZE:
+                            self.__songs_write(songs)
+                            songs = []
+                            await asyncio.sleep(0)  # Lets the screen update between batches
+            self.__songs_write(songs)
+        with self.__db:  # Replaces the index in one transaction, so it's never browsed half filled
+            self.__db.execute("DROP TABLE songs")
+            self.__db.execute("ALTER TABLE songs_new RENAME TO songs")
+            self.__songs_indexes_create()
+            self.__db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('db_update', ?)", (db_update,))
+        logging.info("Indexed mpd library")
+        return True
+
+    def __song_row_get(self, song):
+        track = tag_get(song, 'track').split('/')[0]
+        duration = song.get('duration', song.get('time', 0))
+        return (song['file'], tag_get(song, 'albumartist') or tag_get(song, 'artist'), tag_get(song, 'album'),
+                tag_get(song, 'title'), int(track) if track.isdigit() else None, float(duration or 0))
+
+    def __songs_write(self, songs):
+        self.__db.executemany("INSERT OR REPLACE INTO songs_new VALUES (?, ?, ?, ?, ?, ?)", songs)
+
+    def artists_get(self):
+        """ :return: List of all artists, in alphabetical order. """
+        return [row[0] for row in self.__db_get().execute("SELECT DISTINCT artist FROM songs ORDER BY artist")]
+
+    def albums_get(self, artist=None):
+        """ :return: List of all albums, or only the artist's, in alphabetical order. """
+        if artist is None:
+            rows = self.__db_get().execute("SELECT DISTINCT album FROM songs ORDER BY album")
+        else:
+            rows = self.__db_get().execute("SELECT DISTINCT album FROM songs WHERE artist = ? ORDER BY album",
+                                           (artist,))
+        return [row[0] for row in rows]
+
+    def songs_get(self, artist=None, album=None):
+        """ :return: List of SongRecords of the songs, filtered by artist and/or album, in album and track order. """
+        conditions = []
+        arguments = []
+        if artist is not None:
+            conditions.append("artist = ?")
+            arguments.append(artist)
+        if album is not None:
+            conditions.append("album = ?")
+            arguments.append(album)
+        query = "SELECT file, title, artist, album FROM songs"
+        if len(conditions) > 0:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY artist, album, track, file"
+        return [SongRecord(id=None, file=file, title=title, artist=artist, album=album)
+                for file, title, artist, album in self.__db_get().execute(query, arguments)]
+
+    async def search_index_build(self):
+        """ Builds the search index from the library index, in a thread so the screen keeps updating. """
+        songs = self.__db_get().execute("SELECT file, title, artist, album FROM songs "
+                                        "ORDER BY artist, album, track, file").fetchall()
+        texts = [' '.join((artist, album, title or os.path.basename(file))) for file, title, artist, album in songs]
+        loop = asyncio.get_running_loop()
+        self.search_index = await loop.run_in_executor(None, SearchIndex, texts)
+        self.__search_songs = songs
+        logging.info("Built search index of %d songs", len(songs))
+
+    def search(self, query, limit=50):
+        """ Searches songs by artist, album and title, matching words partly typed or with typing errors.
+
+            :param query: The words searched for
+            :param limit: The maximum number of songs found, default = 50
+            :return: List of SongRecords, best match first
+        """
+        if self.search_index is None:
+            return []
+        return [SongRecord(None, *self.__search_songs[index]) for index in self.search_index.search(query, limit)]
+
+    def browse(self, item_type, artist=None, album=None):
+        """ Lists the library's items of a type.
+
+            :param item_type: :py:const:MPD_TYPE_ARTIST, :py:const:MPD_TYPE_ALBUM or :py:const:MPD_TYPE_SONGS
+            :param artist: Only the items of this artist, default = None
+            :param album: Only the songs of this album, default = None
+            :return: List of artists, albums or SongRecords
+        """
+        if item_type == MPD_TYPE_ARTIST:
+            return self.artists_get()
+        elif item_type == MPD_TYPE_ALBUM:
+            return self.albums_get(artist)
+        elif item_type == MPD_TYPE_SONGS:
+            return self.songs_get(artist, album)
+        raise ValueError("Unknown library item type " + str(item_type))
+
+
 class MPDController(object):
     """ Controls playback and volume
     """
 
     def __init__(self, host, port = 6600):
-        self.mpd_client = MPDClient()
+        self.mpd_client = MPDClient()  # Connection listening to idle notifications and fetching the status
+        self.mpd_commands = MPDConnectionPool(host, port)  # Connections for commands and transfers
         self.host = host
         self.port = port
         self.update_interval = 1000  # Interval between mpc status update calls (milliseconds)
+        self.resync_interval = 30000  # Interval between playing time syncs when subscribed (milliseconds)
         self.volume = 0  # Playback volume
-        self.now_playing = MPDNowPlaying(self.mpd_client)  # Dictionary containing currently playing song info
+        self.options = {}  # Playback options: repeat, random, single and consume
+        self.playlist_version = None  # Version of the queue, changes on every queue modification
+        self.next_song = None  # SongRecord of the song that plays after the current one
+        self.now_playing = MPDNowPlaying(self.mpd_commands)  # Dictionary containing currently playing song info
         self.events = deque([])  # Queue of mpd events
+        self.queue = MPDQueue(self.mpd_commands, self.events)  # Songs in the queue, fetched when needed
+        self.library = MPDLibrary(MPDConnectionPool(host, port, size=1))  # Local index of mpd's music database
 
         self.__now_playing_changed = True
         self.__player_control = ''  # Indicates whether mpd is playing, pausing or has stopped playing music
         self.__muted = False  # Indicates whether muted
         self.__last_update_time = 0  # For checking last update time (milliseconds)
+        self.__last_sync_time = 0  # For checking last playing time sync (milliseconds)
         self.__status = None  # mpc's current status output
+        self.__song_key = None  # Song id, playlist version and state the current song was fetched for
+        self.__song = None  # Record of the current song
+        self.__song_info = None  # mpd's information on the current song
+        self.__next_song_id = None  # Queue id of the next song
+        self.__next_song_info = None  # mpd's information on the next song
+        self.__commands = deque([])  # Player commands waiting to be sent, as tuples of name and arguments
+        self.__commands_unanswered = 0  # Number of player commands queued or sent that mpd hasn't answered
+        self.__state_confirmed = None  # State before the unanswered player commands changed it, for rollback
+        self.__task_commands = None  # Task sending the player commands
+        self.__task_idle = None  # Task listening to mpd's idle notifications
+        self.__task_library = None  # Task filling the library index
+        self.__task_supervisor = None  # Task keeping up the connection to mpd
+        self.__subscribed = False  # Whether idle notifications are wanted, also after reconnecting
+        self.__connected = None  # Event set while connected to mpd
+        self.__connection_lost = None  # Event waking the supervisor when the connection was lost
+        self.__library_sync_again = False  # Whether mpd's database changed while filling the library index
 
     async def connect(self):
-        """ Connects to mpd server.
+        """ Connects to mpd server and fetches its state.
             :return: Boolean indicating if successfully connected to mpd server.
         """
+        self.__events_create()
         try:
-            await self.mpd_client.connect(self.host, self.port)
-        except ConnectionError:
-            logging.error("Failed to connect to MPD server: host: ", self.host, " port: ", self.port)
+            await self.__connect()
+        except CONNECTION_ERRORS as ex:
+            logging.error("Failed to connect to MPD server %s on port %d: %s", self.host, self.port, ex)
             return False
-        current_song = await self.mpd_client.currentsong()
-        self.now_playing.now_playing_set(current_song)
         return True
 
+    async def __connect(self):
+        """ Connects to mpd server within :py:const:CONNECT_TIMEOUT and fetches its state, raising an error from
+            :py:const:CONNECTION_ERRORS when that fails. The controller counts as connected once the state is
+            fetched.
+        """
+        try:
+            await asyncio.wait_for(self.mpd_client.connect(self.host, self.port), CONNECT_TIMEOUT)
+        except CONNECTION_ERRORS:
+            self.mpd_client.disconnect()
+            raise
+        logging.info("Connected to MPD server %s on port %d", self.host, self.port)
+        try:
+            await self.__resync()
+        except BaseException:
+            self.mpd_client.disconnect()
+            self.mpd_commands.close()
+            raise
+        self.__connected.set()  # Only once the state is fetched, so waiting for the connection includes it
+
+    async def __resync(self):
+        """ Fetches mpd's state as a whole, as changes made while not connected were missed. """
+        self.__status = None
+        self.__song_key = None
+        await self.__parse_mpc_status()
+        if self.__subscribed and not self.is_subscribed():
+            self.__task_idle = asyncio.create_task(self.__idle_loop())
+        self.library_sync_start()
+
+    def __events_create(self):
+        """ Creates the connection events once the event loop runs, as Python 3.7 binds them to the event loop
+            running when they're created.
+        """
+        if self.__connected is None:
+            self.__connected = asyncio.Event()
+            self.__connection_lost = asyncio.Event()
+
+    def is_connected(self):
+        """ :return: Boolean indicating whether the controller is connected to mpd. """
+        return self.__connected is not None and self.__connected.is_set()
+
+    async def connection_wait(self, timeout):
+        """ Waits until the controller is connected to mpd.
+
+            :param timeout: Maximum waiting time (seconds)
+            :return: Boolean indicating whether the controller is connected
+        """
+        self.__events_create()
+        try:
+            await asyncio.wait_for(self.__connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.is_connected()
+
+    def connection_lost(self):
+        """ Drops the connection to mpd after a command failed. The supervisor reconnects, meanwhile the last
+            known state stays available.
+        """
+        if not self.is_connected():
+            return
+        logging.warning("Lost connection to MPD server %s", self.host)
+        self.__connected.clear()
+        if self.is_subscribed():
+            self.__task_idle.cancel()
+        self.__task_idle = None
+        self.__commands_drop()
+        self.mpd_client.disconnect()
+        self.mpd_commands.close()
+        self.library.mpd_commands.close()
+        self.__connection_lost.set()
+
+    def supervise(self):
+        """ Starts keeping up the connection to mpd in the background: connecting, checking the connection with
+            keepalive pings and reconnecting with an increasing, jittered wait when it's lost.
+        """
+        self.__events_create()
+        if self.__task_supervisor is None or self.__task_supervisor.done():
+            self.__task_supervisor = asyncio.create_task(self.__supervise())
+
+    async def __supervise(self):
+        wait_ms = RECONNECT_WAIT_MIN  # Wait after an unexpected error, increased while errors keep occurring
+        while True:
+            try:
+                if not self.is_connected():
+                    await retry(self.__connect, ex_type=CONNECTION_ERRORS, wait_ms=RECONNECT_WAIT_MIN,
+                                wait_max_ms=RECONNECT_WAIT_MAX)
+                self.__connection_lost.clear()
+                try:
+                    await asyncio.wait_for(self.__connection_lost.wait(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    await self.__keepalive()
+                wait_ms = RECONNECT_WAIT_MIN
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # Like mpd refusing a command while fetching its state, reconnecting may help
+                logging.exception("Keeping up the connection to MPD server %s failed", self.host)
+                self.connection_lost()
+                await asyncio.sleep(wait_ms / 1000)
+                wait_ms = min(wait_ms * 2, RECONNECT_WAIT_MAX)
+
+    async def __keepalive(self):
+        """ Pings mpd, dropping the connection when it doesn't answer in time. """
+        try:
+            await asyncio.wait_for(self.mpd_client.ping(), CONNECT_TIMEOUT)
+        except CONNECTION_ERRORS:
+            self.connection_lost()
+
+    def library_sync_start(self):
+        """ Starts bringing the library index up to date in the background, unless that's already running. """
+        if self.__task_library is None or self.__task_library.done():
+            self.__task_library = asyncio.create_task(self.__library_sync())
+        else:
+            self.__library_sync_again = True
+
+    async def __library_sync(self):
+        self.__library_sync_again = True
+        while self.__library_sync_again:
+            self.__library_sync_again = False
+            try:
+                synced = await self.library.sync()
+                if synced or self.library.search_index is None:
+                    await self.library.search_index_build()
+                if synced:
+                    self.events.append(EVENT_LIBRARY)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Could not index the mpd library")
+
     def disconnect(self):
         """ Closes the connection to the mpd server. """
         logging.info("Closing down MPD connection")
-        self.mpd_client.close()
+        if self.__task_supervisor is not None:
+            self.__task_supervisor.cancel()
+        if self.__connected is not None:
+            self.__connected.clear()
+        self.unsubscribe()
+        if self.__task_library is not None:
+            self.__task_library.cancel()
+        self.__commands_drop()
         self.mpd_client.disconnect()
+        self.mpd_commands.close()
+        self.library.mpd_commands.close()
+
+    def subscribe(self):
+        """ Switches from polling to subscription mode: the mpd status is only fetched when the server
+            signals a change in one of the :py:const:IDLE_SUBSYSTEMS.
+        """
+        self.__subscribed = True
+        if self.is_connected() and not self.is_subscribed():
+            self.__task_idle = asyncio.create_task(self.__idle_loop())
+
+    def unsubscribe(self):
+        """ Stops listening to mpd's idle notifications, falling back to polling. """
+        self.__subscribed = False
+        if self.is_subscribed():
+            self.__task_idle.cancel()
+        self.__task_idle = None
+
+    def is_subscribed(self):
+        """ :return: Boolean indicating whether the controller listens to mpd's idle notifications. """
+        return self.__task_idle is not None and not self.__task_idle.done()
+
+    async def __idle_loop(self):
+        """ Waits for mpd's idle notifications and parses the changed subsystems. """
+        logging.info("Subscribing to mpd idle events")
+        try:
+            await self.__parse_mpc_status()  # Get the state the notifications are relative to
+            async for subsystems in self.mpd_client.idle(IDLE_SUBSYSTEMS):
+                if isinstance(subsystems, str):
+                    subsystems = [subsystems]
+                logging.info("MPD idle event for %s", ", ".join(subsystems))
+                await self.__parse_idle(subsystems)
+        except asyncio.CancelledError:
+            logging.info("Unsubscribed from mpd idle events")
+            raise
+        except CONNECTION_ERRORS:
+            self.connection_lost()
+        except Exception:
+            logging.exception("Listening to mpd idle events failed, falling back to polling")
+
+    async def __parse_idle(self, subsystems):
+        """ Fetches the state of the subsystems mpd reported as changed and fills the mpd event queue
+
+            :param subsystems: List of changed subsystems
+        """
+        snapshot = await self.snapshot_get(subsystems)
+        status = snapshot.status
+        self.__status = status
+        self.__parse_song_status(status, snapshot.current_song)
+        await self.__parse_next_song_status(status, snapshot.next_song)
+        self.__parse_player_status(status)
+        if 'mixer' in subsystems:
+            self.__parse_mixer_status(status)
+        if 'options' in subsystems:
+            self.__parse_options_status(status)
+        await self.__parse_playlist_status(status)
+        if 'database' in subsystems:
+            self.library_sync_start()
+
+    async def snapshot_get(self, subsystems=None):
+        """ Fetches mpd's status, and the current song and the song that plays next when they could have changed.
+            The asyncio client doesn't support command lists, but it sends each command without waiting for the
+            answers to earlier ones, so commands are pipelined by sending them all before awaiting any.
+
+            Mostly only the status is asked for, and the songs are fetched in a second round trip when the status
+            shows they changed. That keeps polling, and idle events that don't change the songs, at one command.
+            When mpd reports a player or playlist change the songs probably changed too, so they are pipelined
+            with the status in one round trip instead. As the next song can't be asked for before the status is
+            known, it's guessed to be the song after the one that played next at the last status, which it is
+            when playback moved on to that song.
+
+            :param subsystems: The subsystems mpd reported as changed, None when polling
+            :return: StatusSnapshot, with a song None when it wasn't fetched or the next song was guessed wrong
+        """
+        if subsystems is not None and ('player' in subsystems or 'playlist' in subsystems):
+            return await self.__snapshot_pipelined()
+        status = await self.mpd_client.status()
+        current_song_fetch = self.__song_key_get(status) != self.__song_key
+        next_song_id = status.get('nextsongid')
+        next_song_fetch = next_song_id is not None and next_song_id != self.__next_song_id
+        commands = []
+        if current_song_fetch:
+            commands.append(self.mpd_client.currentsong())
+        if next_song_fetch:
+            commands.append(self.mpd_client.playlistid(next_song_id))
+        results = deque(await asyncio.gather(*commands, return_exceptions=True))
+        current_song = results.popleft() if current_song_fetch else None
+        if isinstance(current_song, BaseException):
+            raise current_song
+        next_song = None
+        if next_song_fetch and isinstance(results[0], list) and len(results[0]) > 0:  # Can be gone already
+            next_song = results[0][0]
+        return StatusSnapshot(status, current_song, next_song)
+
+    async def __snapshot_pipelined(self):
+        """ Fetches mpd's status, current song and guessed next song in one round trip.
+
+            :return: StatusSnapshot, with the next song None when it was guessed wrong
+        """
+        commands = [self.mpd_client.status(), self.mpd_client.currentsong()]
+        position_guess = None
+        if self.__status is not None and 'nextsong' in self.__status:
+            position_guess = int(self.__status['nextsong']) + 1
+            commands.append(self.mpd_client.playlistinfo(position_guess))
+        results = await asyncio.gather(*commands, return_exceptions=True)
+        for result in results[:2]:
+            if isinstance(result, BaseException):
+                raise result
+        status, current_song = results[:2]
+        song_next = None
+        if position_guess is not None and isinstance(results[2], list):  # A guess past the queue's end fails
+            for song in results[2]:
+                if song.get('id') == status.get('nextsongid'):
+                    song_next = song
+        return StatusSnapshot(status, current_song, song_next)
+
+    def __song_key_get(self, status):
+        """ :return: The song id, playlist version and state, which change whenever the current song can change. """
+        return status.get('songid'), status.get('playlist'), status.get('state')
+
+    def __parse_song_status(self, status, current_song):
+        """ Parses the current song, but only when the song id, playlist version or state in the mpd status
+            indicate it could have changed.
+
+            :param status: mpd's status output
+            :param current_song: mpd's currentsong output, None when it wasn't fetched
+        """
+        song_key = self.__song_key_get(status)
+        if song_key == self.__song_key or self.is_ahead() or current_song is None:
+            return
+        self.__song_key = song_key
+        self.__parse_song(current_song)
+
+    def __parse_song(self, now_playing_new):
+        """ Parses the current song and fills the mpd event queue
+
+            :param now_playing_new: mpd's currentsong output
+        """
+        song = song_record_get(now_playing_new)
+        if song == self.__song:
+            return
+        song_previous = self.__song
+        self.__song = song
+        self.__song_info = now_playing_new
+        self.__now_playing_changed = True
+        if song is None:
+            self.now_playing.now_playing_set(None)
+            self.events.append(EVENT_PLAYING_FILE)
+            self.events.append(EVENT_ALBUM_CHANGE)
+            return
+        if song_previous is None or song_previous.file != song.file or song_previous.title != song.title:
+            self.events.append(EVENT_PLAYING_FILE)
+        if song_previous is None or song_previous.album != song.album:
+            logging.info("Album change event added")
+            self.events.append(EVENT_ALBUM_CHANGE)
+        self.now_playing.now_playing_set(now_playing_new)
+
+    async def __parse_next_song_status(self, status, next_song=None):
+        """ Looks up the song that plays next in the queue when it changed, so its cover art can be prepared.
+
+            :param status: mpd's status output
+            :param next_song: The next song as fetched with the status, None when it still needs to be fetched
+        """
+        next_song_id = status.get('nextsongid')
+        if next_song_id == self.__next_song_id:
+            return
+        self.__next_song_id = next_song_id
+        if next_song_id is not None and next_song is None:  # Not fetched with the status, costs another round trip
+            try:
+                songs = await self.mpd_client.playlistid(next_song_id)
+            except CommandError as ex:  # Removed from the queue since the status, so the next song is unknown
+                logging.warning("Could not get the next song %s: %s", next_song_id, ex)
+                songs = []
+            next_song = songs[0] if len(songs) > 0 else None
+        self.__next_song_info = next_song if next_song_id is not None else None
+        self.next_song = song_record_get(next_song) if self.__next_song_info is not None else None
+        self.events.append(EVENT_NEXT_SONG)
+
+    async def __parse_playlist_status(self, status):
+        """ Updates the queue when the playlist version in the mpd status changed and fills the mpd event queue
+
+            :param status: mpd's status output
+        """
+        if await self.queue.update(status):
+            self.playlist_version = status.get('playlist')
+            self.events.append(EVENT_PLAYLIST)
+
+    def __parse_player_status(self, status):
+        """ Parses the play state and elapsed time from the mpd status and fills the mpd event queue
+
+            :param status: mpd's status output
+        """
+        self.__last_sync_time = round(time.time()*1000)
+        if self.is_ahead():
+            return
+        self.__player_control_apply(status['state'], self.str_to_float(status.get('elapsed', 0)))
+
+    def __player_control_apply(self, state, seconds):
+        """ Sets the play state and playing time and fills the mpd event queue
+
+            :param state: Playback state ['play', 'pause', 'stop']
+            :param seconds: Playing time of the current song (seconds)
+        """
+        if self.__player_control != state:
+            self.__player_control = state
+            self.events.append(EVENT_PLAYER_CONTROL)
+        if self.now_playing.clock_sync(seconds, state):
+            self.__time_elapsed_event()
+
+    def __time_elapsed_event(self):
+        """ Adds a time elapsed event, unless one is still waiting in the queue. """
+        if EVENT_TIME_ELAPSED not in self.events:
+            self.events.append(EVENT_TIME_ELAPSED)
+
+    def __parse_mixer_status(self, status):
+        if not self.is_ahead():
+            self.__volume_apply(int(self.str_to_float(status.get('volume', 0))))
+
+    def __volume_apply(self, volume):
+        if self.volume != volume:
+            self.volume = volume
+            self.events.append(EVENT_VOLUME)
+
+    def __parse_options_status(self, status):
+        options = {key: status.get(key) for key in ('repeat', 'random', 'single', 'consume')}
+        if self.options != options:
+            self.options = options
+            self.events.append(EVENT_OPTIONS)
 
     async def __parse_mpc_status(self):
         """ Parses the mpd status and fills mpd event queue
@@ -228,29 +1046,31 @@ class MPDController(object):
             :return: Boolean indicating if the status was changed
         """
         logging.info("Trying to get mpd status")
-        self.mpd_client.ping() # Wake up MPD
-        # Song information
-        now_playing_new = await self.mpd_client.currentsong()
-        if self.now_playing != now_playing_new and len(now_playing_new) > 0:  # Changed to a new song
-            self.__now_playing_changed = True
-            if self.now_playing is None or self.now_playing.file != now_playing_new['file']:
-                self.events.append('playing_file')
-            self.__radio_mode = self.now_playing.playing_type == 'radio'
-            if self.now_playing.album == '' or self.now_playing.album != now_playing_new['album']:
-                logging.info("Album change event added")
-                self.events.append('album_change')
-            self.now_playing.now_playing_set(now_playing_new)
-        # Player status
-        status = await self.mpd_client.status()
+        # Player status and song information
+        snapshot = await self.snapshot_get()
+        status = snapshot.status
         if self.__status == status:
             return False
         self.__status = status
-        if self.__player_control != status['state']:
-            self.__player_control = status['state']
-            self.events.append('player_control')
-        if self.__player_control != 'stop':
-            if self.now_playing.current_time_set(self.str_to_float(status['elapsed'])):
-                self.events.append('time_elapsed')
+        self.__parse_song_status(status, snapshot.current_song)
+        await self.__parse_next_song_status(status, snapshot.next_song)
+        self.__parse_player_status(status)
+        self.__parse_mixer_status(status)
+        self.__parse_options_status(status)
+        await self.__parse_playlist_status(status)
+        return True
+
+    async def __parse_elapsed(self):
+        """ Resynchronises the playing time, which mpd's idle notifications don't report, to correct
+            any drift of the playback clock.
+
+            :return: Boolean indicating if the elapsed time was changed
+        """
+        if self.__player_control != 'play':
+            return False
+        status = await self.mpd_client.status()
+        self.__status = status
+        self.__parse_player_status(status)
         return True
 
     def str_to_float(self, s):
@@ -261,15 +1081,32 @@ class MPDController(object):
 
     async def status_get(self):
         """ Updates mpc data, returns True when status data is updated. Wait at
-            least 'update_interval' milliseconds before updating mpc status data.
+            least 'update_interval' milliseconds before updating mpc status data, in between
+            the playing time is advanced by the playback clock. When subscribed to idle
+            notifications the playing time is only resynced every 'resync_interval' milliseconds.
 
             :return: Returns boolean whether updated or not.
         """
-        time_elapsed = round(time.time()*1000) - self.__last_update_time
-        if round(time.time()*1000) > self.update_interval > time_elapsed:
+        if self.now_playing.clock_tick():
+            self.__time_elapsed_event()
+        if not self.is_connected():  # Keeps the last known state until the supervisor reconnected
+            return False
+        try:
+            if self.is_subscribed():
+                if round(time.time()*1000) - self.__last_sync_time < self.resync_interval:
+                    return False
+                return await self.__parse_elapsed()
+            time_elapsed = round(time.time()*1000) - self.__last_update_time
+            if round(time.time()*1000) > self.update_interval > time_elapsed:
+                return False
+            self.__last_update_time = round(time.time()*1000)  # Reset update
+            return await self.__parse_mpc_status()  # Parse mpc status output
+        except CONNECTION_ERRORS:
+            self.connection_lost()
+            return False
+        except CommandError as ex:  # Keeps the screen running, the status is fetched again at the next update
+            logging.error("Could not get the mpd status: %s", ex)
             return False
-        self.__last_update_time = round(time.time()*1000)  # Reset update
-        return await self.__parse_mpc_status()  # Parse mpc status output
 
     def current_song_changed(self):
         if self.__now_playing_changed:
@@ -278,32 +1115,138 @@ class MPDController(object):
         else:
             return False
 
+    async def command(self, name, *args):
+        """ Sends a command to mpd on a command connection, so it doesn't wait for idle notifications, status
+            updates or transfers.
+
+            :param name: The name of the command
+            :param args: The command's arguments
+            :return: mpd's answer
+        """
+        async with self.mpd_commands.connection() as client:
+            return await getattr(client, name)(*args)
+
     def player_control_set(self, play_status):
-        """ Controls playback
+        """ Controls playback. The play state, playing time and, for next, the current song change right away,
+            so the controls respond without waiting for mpd; the command is sent to mpd in the background.
 
             :param play_status: Playback action ['play', 'pause', 'stop', 'next', 'previous']
         """
         logging.info("MPD player control %s", play_status)
+        if play_status == 'play':
+            self.__command_queue(*(('pause', 0) if self.__player_control == 'pause' else ('play',)))
+            self.__player_control_apply('play', self.now_playing.clock_get())
+        elif play_status == 'pause':
+            self.__command_queue('pause', 1)
+            if self.__player_control == 'play':
+                self.__player_control_apply('pause', self.now_playing.clock_get())
+        elif play_status == 'stop':
+            self.__command_queue('stop')
+            self.__player_control_apply('stop', 0)
+        elif play_status == 'next':
+            self.__command_queue('next')
+            if self.__next_song_info is not None:  # Otherwise the next song is unknown till mpd answers
+                self.__parse_song(self.__next_song_info)
+                self.__player_control_apply(self.__player_control, 0)
+        elif play_status == 'previous':
+            self.__command_queue('previous')  # The previous song is unknown till mpd answers
+
+    def queue_play(self, position):
+        """ Starts playing the song at a position in the queue.
+
+            :param position: The song's position in the queue
+        """
+        logging.info("MPD playing queue position %d", position)
+        self.__command_queue('play', position)
+        self.__player_control_apply('play', 0)
+
+    def volume_set(self, volume):
+        """ Sets the playback volume, which changes right away while the command is sent to mpd in the background.
+
+            :param volume: The volume [0-100]
+        """
+        volume = max(0, min(100, int(volume)))
+        self.__command_queue('setvol', volume)
+        self.__volume_apply(volume)
+
+    def is_ahead(self):
+        """ :return: Boolean indicating whether the player state was changed by commands mpd hasn't answered yet,
+            during which the status mpd reports may be older than the local state.
+        """
+        return self.__commands_unanswered > 0
+
+    def __command_queue(self, name, *args):
+        """ Queues a player command, to be called before its change is applied to the local state. A volume
+            change replaces one still waiting, so dragging a volume slider doesn't queue up commands.
+
+            :param name: The name of the command
+            :param args: The command's arguments
+        """
+        if self.__state_confirmed is None:
+            self.__state_confirmed = (self.__player_control, self.volume, self.__song_info,
+                                      self.now_playing.clock_get())
+        if name == 'setvol' and len(self.__commands) > 0 and self.__commands[-1][0] == 'setvol':
+            self.__commands[-1] = (name, args)
+        else:
+            self.__commands.append((name, args))
+            self.__commands_unanswered += 1
+        if self.__task_commands is None or self.__task_commands.done():
+            self.__task_commands = asyncio.create_task(self.__commands_send())
+
+    async def __commands_send(self):
+        """ Sends the queued player commands in order, each after mpd answered the one before. When a command
+            fails or isn't answered within :py:const:CONNECT_TIMEOUT the commands after it are dropped and the
+            state before the commands is restored. Once all commands are answered the local state is replaced by
+            mpd's.
+        """
+        while len(self.__commands) > 0:
+            name, args = self.__commands.popleft()
+            try:
+                await asyncio.wait_for(self.command(name, *args), CONNECT_TIMEOUT)
+                self.__commands_unanswered -= 1
+            except (CommandError,) + CONNECTION_ERRORS as ex:
+                logging.error("Could not send %s command to MPD: %r", name, ex)
+                self.__commands_drop(task_cancel=False)
+            if len(self.__commands) == 0:
+                await self.__reconcile()
+
+    def __commands_drop(self, task_cancel=True):
+        """ Drops the player commands mpd hasn't answered, restoring the state from before them.
+
+            :param task_cancel: Whether to cancel the task sending the commands, default = True
+        """
+        if task_cancel and self.__task_commands is not None:
+            self.__task_commands.cancel()
+        self.__commands.clear()
+        self.__commands_unanswered = 0
+        if self.__state_confirmed is not None:
+            self.__state_restore(self.__state_confirmed)
+            self.__state_confirmed = None
+
+    def __state_restore(self, state):
+        """ Rolls the local state back to how it was before the unanswered player commands changed it. """
+        player_control, volume, song_info, seconds = state
+        if song_info is not None:
+            self.__parse_song(song_info)
+        self.__player_control_apply(player_control, seconds)
+        self.__volume_apply(volume)
+
+    async def __reconcile(self):
+        """ Replaces the local state by mpd's once it answered all player commands. """
+        self.__state_confirmed = None
+        if not self.is_connected():  # Reconnecting fetches mpd's state
+            return
+        self.__status = None
+        self.__song_key = None
         try:
-            if play_status == 'play':
-                if self.__player_control == 'pause':
-                    self.mpd_client.play()
-                else:
-                    self.mpd_client.pause(0)
-            elif play_status == 'pause':
-                self.mpd_client.pause(1)
-            elif play_status == 'stop':
-                self.mpd_client.stop()
-            elif play_status == 'next':
-                self.mpd_client.next()
-            elif play_status == 'previous':
-                self.mpd_client.previous()
-        except:
-            logging.error("Could not send %s command to MPD", play_status)
+            await self.__parse_mpc_status()
+        except CONNECTION_ERRORS:
+            self.connection_lost()
+        except CommandError as ex:  # The status is fetched again at the next update
+            logging.error("Could not get the mpd status: %s", ex)
 
     async def player_control_get(self):
-        """ :return: Current playback mode. """
-        await mpd.status_get()
+        """ :return: Current playback mode, as of the last status update. """
         return self.__player_control
 
 
@@ -20,89 +20,166 @@
 =======================================================
 """
 import asyncio
-from PIL import Image, ImageFilter, ImageEnhance
+from concurrent.futures import ThreadPoolExecutor
 
 from settings import *
 from mpd_client import *
 from capture_audio import *
+from cover_art import *
 from gui_screens import *
+from screen_queue import ScreenQueue
+from screen_search import ScreenSearch
 
 logging.info("ScreenPlaying definition")
 
 
 class ScreenPlayer(Screen):
-    """ Screen cover art
+    """ Screen cover art. Swiping up or the q key opens the queue, swiping down or the / key opens the library
+        search.
     """
     def __init__(self, screen_surface, name_sound_device):
         Screen.__init__(self, screen_surface)
         self.timer = pygame.time.get_ticks
         self.blank_screen_time = self.timer() + BLANK_PERIOD
         self.is_blank_screen = False
-        self.file_img_cover = 'default_cover_art.png'
+        self.cover_art = None  # Cover art of the playing album and the images derived from it
+        self.cover_art_cache = CoverArtCache()
+        self.cover_art_next = None  # Album key and task preparing the cover art of the next song
+        self.task_cover_art = None  # Task updating the cover art of the playing album
+        # Cover art is decoded, rendered and cached in a thread so the screen keeps updating; a single
+        # worker also serialises access to the cache
+        self.executor_cover_art = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cover_art')
         self.coverart_color = 0
         self.amplitude = 0
-        self.audio_spectrometer = AudioSpectrometer(name_device=name_sound_device,
-                                                    block_time=INPUT_BLOCK_TIME,
-                                                    sound_rate=INPUT_SOUND_RATE
-                                                    )
-        self.add_component(Picture(name='pic_background', surface=self.surface,
+        if INPUT_ANALYSIS_PROCESS:
+            self.audio_spectrometer = AudioSpectrometerProcess(name_device=name_sound_device,
+                                                               block_time=INPUT_BLOCK_TIME,
+                                                               sound_rate=INPUT_SOUND_RATE
+                                                               )
+        else:
+            self.audio_spectrometer = AudioSpectrometer(name_device=name_sound_device,
+                                                        block_time=INPUT_BLOCK_TIME,
+                                                        sound_rate=INPUT_SOUND_RATE,
+                                                        use_callback=INPUT_CAPTURE_CALLBACK
+                                                        )
+        self.add_component(Picture(name='pic_background', surface=self.layer_background,
                                    surface_pos=(0, 0), widget_dims =(SCREEN_WIDTH, SCREEN_HEIGHT), image_file='background.png'))
+        self.components['pic_background'].zoom_max = 80
         picture_pos = (((SCREEN_WIDTH/2)-(SCREEN_HEIGHT/2) + 15), 25)
-        self.add_component(Picture(name='pic_cover_art', surface=self.surface,
+        self.add_component(Picture(name='pic_cover_art', surface=self.layer_background,
                                    surface_pos=picture_pos, widget_dims =(SCREEN_HEIGHT - 40, SCREEN_HEIGHT - 40),
-                                   image_file=self.file_img_cover))
+                                   image_file=DEFAULT_COVER))
         self.add_component(LabelText(name='lbl_track_title', surface=self.surface,
                                      surface_pos=(0, 0), widget_dims=(SCREEN_WIDTH, 38), alignment=(HOR_LEFT, VERT_BOTTOM)))
         self.components['lbl_track_title'].background_alpha_set(180)
+        self.components['lbl_track_title'].scroll_set(True)
         self.add_component(Slider2(name='slide_time', surface=self.surface,
                                    surface_pos=(0, SCREEN_HEIGHT - 10), widget_dims=(SCREEN_WIDTH, 10)))
         self.add_component(LabelText(name='lbl_track_artist', surface=self.surface,
                                      surface_pos=(0, SCREEN_HEIGHT - 42), widget_dims=(SCREEN_WIDTH, 32), alignment=(HOR_RIGHT, VERT_TOP)))
         self.components['lbl_track_artist'].background_alpha_set(180)
 
-    async def create_background(self):
-        image = Image.open(self.file_img_cover)
-        image = image.resize((SCREEN_WIDTH, SCREEN_WIDTH))
-        image = image.crop((0, (SCREEN_WIDTH - SCREEN_HEIGHT)/2, SCREEN_WIDTH, SCREEN_WIDTH - (SCREEN_WIDTH - SCREEN_HEIGHT)/2))
-        image = image.filter(ImageFilter.GaussianBlur(8))
-        image = ImageEnhance.Brightness(image).enhance(0.6)
-        image.save('background.png')
+    async def cover_art_get(self, key, file):
+        """ Gets cover art from the cache, or retrieves it from mpd and renders it.
+
+            :param key: The album's key in the cover art cache
+            :param file: A file of the album
+            :return: The rendered CoverArt
+        """
+        loop = asyncio.get_running_loop()
+        cover_dims = (self.components['pic_cover_art'].width, self.components['pic_cover_art'].height)
+        cover_art = CoverArt(cover_dims=cover_dims, background_dims=(SCREEN_WIDTH, SCREEN_HEIGHT))
+        if not await loop.run_in_executor(self.executor_cover_art, self.cover_art_cache.load, key, cover_art):
+            blob_cover = await mpd.now_playing.get_cover_binary(file)
+            await loop.run_in_executor(self.executor_cover_art, self.cover_art_render, key, cover_art, blob_cover)
+        cover_art.background_zoom_stack = await loop.run_in_executor(
+            self.executor_cover_art, self.components['pic_background'].zoom_stack_create, cover_art.background)
+        return cover_art
+
+    def cover_art_render(self, key, cover_art, blob_cover):
+        """ Renders cover art and stores it in the cache, runs in the cover art executor. """
+        cover_art.render(blob_cover)
+        self.cover_art_cache.save(key, cover_art)
+
+    def cover_art_prefetch(self):
+        """ Starts preparing the cover art of the next song in the queue when it's from another album. """
+        next_song = mpd.next_song
+        key = None
+        if next_song is not None:
+            key = self.cover_art_cache.key_get(next_song.artist, next_song.album)
+        if self.cover_art_next is not None:
+            if self.cover_art_next[0] == key:
+                return
+            self.cover_art_next[1].cancel()
+            self.cover_art_next = None
+        if key is None or key == self.cover_art_cache.key_get(mpd.now_playing.artist, mpd.now_playing.album):
+            return
+        logging.info("Prefetching cover art of %s", next_song.album)
+        self.cover_art_next = (key, asyncio.create_task(self.cover_art_get(key, next_song.file)))
+
+    def cover_art_update_start(self):
+        """ Starts updating the cover art in the background, cancelling an update for an album that's no
+            longer playing.
+        """
+        if self.task_cover_art is not None and not self.task_cover_art.done():
+            self.task_cover_art.cancel()
+        self.task_cover_art = asyncio.create_task(self.cover_art_update())
+
+    async def cover_art_update(self):
+        """ Shows the playing song's cover art with its background and color theme, using the prefetched
+            cover art when it's of the same album.
+        """
+        key = self.cover_art_cache.key_get(mpd.now_playing.artist, mpd.now_playing.album)
+        cover_art = None
+        if self.cover_art_next is not None:
+            key_next, task_next = self.cover_art_next
+            self.cover_art_next = None
+            if key_next == key:
+                try:
+                    cover_art = await task_next
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logging.exception("Prefetching cover art failed")
+            else:
+                task_next.cancel()
+        if cover_art is None:
+            cover_art = await self.cover_art_get(key, mpd.now_playing.file)
+        self.cover_art = cover_art
+        self.components['pic_cover_art'].picture_surface_set(self.cover_art.cover)
+        self.components['pic_background'].picture_surface_set(self.cover_art.background)
+        self.components['pic_background'].zoom_stack_set(self.cover_art.background_zoom_stack)
+        self.apply_color_theme()
 
     async def show(self):
         """ Displays the screen. """
-        self.file_img_cover = await mpd.now_playing.get_cover_art()
-        self.components['pic_cover_art'].picture_set(self.file_img_cover)
-        await self.create_background()
-        self.components['pic_background'].picture_set('background.png')
+        await self.refresh()
+        return await super(ScreenPlayer, self).show()
+
+    async def refresh(self):
+        """ Updates the cover art and song information to the playing song. """
+        await self.cover_art_update()
         self.components['lbl_track_title'].text_set('    ' + mpd.now_playing.title + '    ')
         self.components['lbl_track_title'].adjust_to_caption_size()
         self.components['lbl_track_artist'].text_set('    ' + mpd.now_playing.artist + '    ')
         self.components['lbl_track_artist'].adjust_to_caption_size()
-        self.apply_color_theme()
-        return await super(ScreenPlayer, self).show()
 
     async def update(self):
-        task_mpd = asyncio.create_task(self.hook_event())
-        await task_mpd
+        await self.hook_event()
         try:
             event = mpd.events.popleft()
             playing = mpd.now_playing
-            if event == 'time_elapsed':
+            if event == EVENT_TIME_ELAPSED:
                 self.components['slide_time'].progress_percentage_set(playing.time_percentage)
-            if event == 'playing_file':
+            if event == EVENT_PLAYING_FILE:
                 self.components['lbl_track_title'].text_set('    ' + mpd.now_playing.title + '    ')
                 self.components['lbl_track_title'].adjust_to_caption_size()
                 self.components['lbl_track_artist'].text_set('    ' + mpd.now_playing.artist + '    ')
                 self.components['lbl_track_artist'].adjust_to_caption_size()
-            if event == 'album_change':
-                self.file_img_cover = await mpd.now_playing.get_cover_art()
-                await self.create_background()
-                self.components['pic_cover_art'].picture_set(self.file_img_cover)
-                self.components['pic_background'].picture_set('background.png')
-                self.apply_color_theme()
-            if event == 'album_change' or event == 'playing_file':
-                task_show = asyncio.create_task(super(ScreenPlayer, self).show())
-                await task_show
+            if event == EVENT_ALBUM_CHANGE:
+                self.cover_art_update_start()
+            if event == EVENT_NEXT_SONG:
+                self.cover_art_prefetch()
         except IndexError:
             pass
         self.amplitude = self.audio_spectrometer.listen()
@@ -111,11 +188,7 @@ class ScreenPlayer(Screen):
 
     def update_spectrometer(self):
         change_factor = round(self.amplitude / 400)
-        x_size = 800 + change_factor
-        y_size = 480 # + change_factor
-        x_pos = round((change_factor) / 2)
-        y_pos = 0
-        self.components['pic_background'].position_size_set(x=x_pos, y=y_pos, width=x_size, height=y_size)
+        self.components['pic_background'].zoom_set(change_factor)
 
     async def draw_cover_art(self):
         left_position = 40
@@ -126,12 +199,12 @@ class ScreenPlayer(Screen):
             cover_size = vert_length
         else:
             cover_size = hor_length
-        self.file_img_cover = await mpd.now_playing.get_cover_art()
-        self.add_component(Picture(name='pic_cover_art', surface=self.layer_foreground,
-                                   surface_pos=(left_position, top_position), widget_dims=(cover_size, cover_size), image_file=self.file_img_cover))
+        self.add_component(Picture(name='pic_cover_art', surface=self.layer_background,
+                                   surface_pos=(left_position, top_position), widget_dims=(cover_size, cover_size)))
+        await self.cover_art_update()
 
     def apply_color_theme(self):
-        self.coverart_color = self.components['pic_cover_art'].color_main()
+        self.coverart_color = self.cover_art.colors
         self.color = self.coverart_color[0]
         self.components['slide_time'].bottom_color = self.coverart_color[0]
         color_complimentary = np.subtract((255, 255, 255), self.color)
@@ -146,6 +219,20 @@ class ScreenPlayer(Screen):
         self.components['lbl_track_title'].background_color = self.color
         self.components['lbl_track_artist'].font_color = color_font
         self.components['lbl_track_artist'].background_color = self.color
+        for name in ('slide_time', 'lbl_track_title', 'lbl_track_artist'):
+            self.components[name].dirty_set()
+
+    def on_key(self, event):
+        if event.key == K_q:
+            self.screen_open(ScreenQueue(self))
+        elif event.key == K_SLASH:
+            self.screen_open(ScreenSearch(self))
+
+    def on_swipe(self, x, y, swipe_type):
+        if swipe_type == GESTURE_SWIPE_UP:
+            self.screen_open(ScreenQueue(self))
+        elif swipe_type == GESTURE_SWIPE_DOWN:
+            self.screen_open(ScreenSearch(self))
 
     async def hook_event(self):
         await mpd.status_get()
@@ -157,7 +244,8 @@ class ScreenPlayer(Screen):
             if self.is_blank_screen:
                 self.surface.fill(pygame.Color(0,0,0,0))
                 self.is_blank_screen = False
-                await self.show()
+                await self.refresh()
+                self.draw_full()
             else:
                 self.redraw()
         elif not is_playing and self.timer() > self.blank_screen_time: #and self.current_index != 1:
@@ -166,8 +254,10 @@ class ScreenPlayer(Screen):
             pygame.display.flip()
             while not is_playing:
                 pygame.event.get()
+                await asyncio.sleep(mpd.update_interval / 1000)  # Lets the mpd idle listener run
                 await mpd.status_get()
                 mpd_control_status = await mpd.player_control_get()
                 is_playing = mpd_control_status != 'pause' and mpd_control_status != 'stop'
             self.blank_screen_time = self.timer() + BLANK_PERIOD
-            await self.show()
+            await self.refresh()
+            self.draw_full()
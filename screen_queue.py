@@ -0,0 +1,83 @@
+# This file is part of pi-jukebox.
+#
+# pi-jukebox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-jukebox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pi-jukebox. If not, see < http://www.gnu.org/licenses/ >.
+#
+# (C) 2015- by Mark Zwart, <mark.zwart@pobox.com>
+"""
+=======================================================
+**screen_queue.py**: Queue screen.
+=======================================================
+"""
+from settings import *
+from mpd_client import *
+from gui_screens import *
+
+
+def song_text_get(song):
+    """ :return: The text showing a song in a list, empty for a song that's still being fetched. """
+    if song is None:
+        return ''
+    title = song.title if song.title != '' else os.path.basename(song.file)
+    if song.artist == '':
+        return title
+    return song.artist + ' - ' + title
+
+
+class ScreenQueue(Screen):
+    """ Screen showing mpd's queue, which only fetches the songs showing in the list. A horizontal swipe or
+        the backspace key closes it.
+    """
+    def __init__(self, screen_surface):
+        Screen.__init__(self, screen_surface)
+        self.add_component(ItemList(name='list_queue', surface=self.surface,
+                                    surface_pos=(0, 0), widget_dims=(SCREEN_WIDTH, SCREEN_HEIGHT)))
+        self.components['list_queue'].list_set(ItemSource(lambda: len(mpd.queue), self.items_get))
+
+    def items_get(self, start, end):
+        """ :return: The texts of the queue's songs from start up to end. """
+        return [song_text_get(song) for song in mpd.queue.songs_get(start, end)]
+
+    async def show(self):
+        """ Displays the screen. """
+        self.components['list_queue'].active_item_index = mpd.queue.position
+        self.components['list_queue'].show_item_active()
+        return await super(ScreenQueue, self).show()
+
+    async def update(self):
+        await mpd.status_get()
+        list_queue = self.components['list_queue']
+        if EVENT_QUEUE in mpd.events:  # Only takes the queue's events, the player screen handles the others
+            while EVENT_QUEUE in mpd.events:
+                mpd.events.remove(EVENT_QUEUE)
+            list_queue.dirty_set()
+        if list_queue.active_item_index != mpd.queue.position:
+            list_queue.active_item_index = mpd.queue.position
+            list_queue.dirty_set()
+        self.redraw()
+
+    def on_click(self, x, y):
+        tag_name = super(ScreenQueue, self).on_click(x, y)
+        if tag_name == 'list_queue' and self.components['list_queue'].item_selected_index >= 0:
+            mpd.queue_play(self.components['list_queue'].item_selected_index)
+        return tag_name
+
+    def on_key(self, event):
+        if event.key == K_BACKSPACE:
+            self.close()
+
+    def on_swipe(self, x, y, swipe_type):
+        if swipe_type == GESTURE_SWIPE_LEFT or swipe_type == GESTURE_SWIPE_RIGHT:
+            self.close()
+        else:
+            super(ScreenQueue, self).on_swipe(x, y, swipe_type)
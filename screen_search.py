@@ -0,0 +1,90 @@
+# This file is part of pi-jukebox.
+#
+# pi-jukebox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-jukebox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pi-jukebox. If not, see < http://www.gnu.org/licenses/ >.
+#
+# (C) 2015- by Mark Zwart, <mark.zwart@pobox.com>
+"""
+=======================================================
+**screen_search.py**: Library search screen.
+=======================================================
+"""
+import asyncio
+
+from settings import *
+from mpd_client import *
+from gui_screens import *
+from screen_queue import song_text_get
+
+#: Maximum number of songs a search shows
+SEARCH_RESULTS_MAX = 200
+
+
+class ScreenSearch(Screen):
+    """ Screen searching the library index while the query is typed, without asking mpd. Clicking a song found
+        adds it to the queue. A horizontal swipe, or backspace when there's no query left, closes it.
+
+        :ivar query: The text searched for
+        :ivar songs: SongRecords of the songs found, best match first
+    """
+    def __init__(self, screen_surface):
+        Screen.__init__(self, screen_surface)
+        self.query = ''
+        self.songs = []
+        self.add_component(LabelText(name='lbl_query', surface=self.surface,
+                                     surface_pos=(0, 0), widget_dims=(SCREEN_WIDTH, 40)))
+        self.add_component(ItemList(name='list_songs', surface=self.surface,
+                                    surface_pos=(0, 40), widget_dims=(SCREEN_WIDTH, SCREEN_HEIGHT - 40)))
+
+    def query_set(self, query):
+        """ Searches the library for the query and shows the songs found. """
+        self.query = query
+        self.songs = mpd.library.search(query, limit=SEARCH_RESULTS_MAX) if query.strip() != '' else []
+        self.components['lbl_query'].text_set(query)
+        self.components['list_songs'].list_set([song_text_get(song) for song in self.songs])
+
+    async def update(self):
+        await mpd.status_get()
+        if EVENT_LIBRARY in mpd.events:  # Only takes the library's events, the player screen handles the others
+            while EVENT_LIBRARY in mpd.events:
+                mpd.events.remove(EVENT_LIBRARY)
+            self.query_set(self.query)  # Searches the library index that was filled again
+        self.redraw()
+
+    def on_key(self, event):
+        if event.key == K_BACKSPACE:
+            if self.query == '':
+                self.close()
+            else:
+                self.query_set(self.query[:-1])
+        elif event.unicode.isprintable() and event.unicode != '':
+            self.query_set(self.query + event.unicode)
+
+    def on_swipe(self, x, y, swipe_type):
+        if swipe_type == GESTURE_SWIPE_LEFT or swipe_type == GESTURE_SWIPE_RIGHT:
+            self.close()
+        else:
+            super(ScreenSearch, self).on_swipe(x, y, swipe_type)
+
+    def on_click(self, x, y):
+        tag_name = super(ScreenSearch, self).on_click(x, y)
+        if tag_name == 'list_songs' and 0 <= self.components['list_songs'].item_selected_index < len(self.songs):
+            asyncio.create_task(self.song_add(self.songs[self.components['list_songs'].item_selected_index]))
+        return tag_name
+
+    async def song_add(self, song):
+        """ Adds a song found to the end of the queue. """
+        try:
+            await mpd.command('add', song.file)
+        except (CommandError,) + CONNECTION_ERRORS as ex:
+            logging.error("Could not add %s to the queue: %r", song.file, ex)
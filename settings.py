@@ -35,6 +35,8 @@ import pygame
 NAME_SOUND_DEVICE = 'default'
 INPUT_SOUND_RATE = 10000 # 44100
 INPUT_BLOCK_TIME = 0.005 # 30 ms
+INPUT_CAPTURE_CALLBACK = True # Capture in PyAudio's callback thread instead of blocking reads
+INPUT_ANALYSIS_PROCESS = False # Capture and analyse sound in a separate process
 
 #: Switches between development/debugging on your desktop/laptop versus running on your Raspberry Pi
 RUN_ON_RASPBERRY_PI = os.uname()[4] == 'aarch64'
@@ -50,7 +52,10 @@ if RUN_ON_RASPBERRY_PI:
 pygame.init() 	# Pygame initialization
 #: The display dimensions, change this if you have a bigger touch screen.
 DISPLAY_SIZE = SCREEN_WIDTH, SCREEN_HEIGHT = 800, 480
-PYGAME_EVENT_DELAY = 0 #25
+#: Maximum number of screen updates per second
+FRAME_RATE = 30
+#: Number of screen updates per second while nothing changes on screen
+FRAME_RATE_IDLE = 5
 
 if RUN_ON_RASPBERRY_PI:  # If started on Raspberry Pi
     display_flags = pygame.FULLSCREEN | pygame.SRCALPHA # Turn on video acceleration
@@ -63,6 +68,13 @@ else:
 #: The directory where resources like button icons or the font file is stored.
 RESOURCES = os.path.dirname(__file__) + '/resources/'
 
+#: The directory where cover art and the images derived from it are cached.
+COVER_CACHE_DIR = os.path.expanduser('~/.cache/pi-jukebox/covers/')
+#: Maximum size of the cover art cache (bytes)
+COVER_CACHE_SIZE_MAX = 200 * 1024 * 1024
+#: File of the local index of mpd's music database
+LIBRARY_FILE = os.path.expanduser('~/.cache/pi-jukebox/library.db')
+
 #: Standard font type
 FONT = pygame.font.Font(RESOURCES + 'DroidSans.ttf', 26)
 
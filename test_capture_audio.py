@@ -0,0 +1,72 @@
+import numpy as np
+
+import capture_audio
+from capture_audio import AudioSpectrometer, SpectrumAnalyser
+
+
+def sine(frequency, sound_rate, count, amplitude=16000):
+    return (amplitude * np.sin(2 * np.pi * frequency * np.arange(count) / sound_rate)).astype(np.int16)
+
+
+def band_of(analyser, frequency):
+    """ :return: Index of the band containing a frequency, found from the band edges. """
+    edges = np.geomspace(40, min(16000, analyser.sound_rate / 2), analyser.band_count + 1)
+    return int(np.searchsorted(edges, frequency)) - 1
+
+
+def test_silence_has_no_levels():
+    analyser = SpectrumAnalyser(sound_rate=10000, band_count=16, fft_size=512, attack=1, release=1)
+    bands = analyser.analyse(np.zeros(2048, dtype=np.int16))
+    assert bands.shape == (16,)
+    assert np.all(bands == 0)
+
+
+def test_sine_peaks_in_its_band():
+    analyser = SpectrumAnalyser(sound_rate=10000, band_count=16, fft_size=512, attack=1, release=1)
+    bands = analyser.analyse(sine(1000, 10000, 2048))
+    assert int(np.argmax(bands)) == band_of(analyser, 1000)
+    assert np.all((bands >= 0) & (bands <= 1))
+
+
+def test_levels_rise_fast_and_fall_slowly():
+    analyser = SpectrumAnalyser(sound_rate=10000, band_count=16, fft_size=512, attack=0.9, release=0.1)
+    band = band_of(analyser, 1000)
+    level_loud = analyser.analyse(sine(1000, 10000, 2048))[band]
+    level_after = analyser.analyse(np.zeros(2048, dtype=np.int16))[band]
+    assert level_loud > 0.5
+    assert level_loud * 0.8 < level_after < level_loud
+
+
+def test_short_input_is_padded():
+    analyser = SpectrumAnalyser(sound_rate=10000, band_count=8, fft_size=512)
+    assert analyser.analyse(sine(1000, 10000, 100)).shape == (8,)
+
+
+class SoundStream(object):
+    """ Fakes a sound device giving blocks of increasing sample values. """
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self.sample = 0
+
+    def read(self, frame_count, exception_on_overflow=True):
+        block = np.arange(self.sample, self.sample + frame_count, dtype=np.int16)
+        self.sample += frame_count
+        return block.tobytes()
+
+
+def spectrometer_fake(monkeypatch, ring_size):
+    monkeypatch.setattr(capture_audio.pyaudio, 'PyAudio', lambda: None)
+    monkeypatch.setattr(AudioSpectrometer, 'open_sound_stream', lambda self: SoundStream(self.frames_per_block))
+    return AudioSpectrometer(sound_rate=10000, block_time=0.01, use_callback=False, ring_size=ring_size,
+                             band_count=8)
+
+
+def test_ring_buffer_keeps_latest_samples_in_order(monkeypatch):
+    spectrometer = spectrometer_fake(monkeypatch, ring_size=4096)
+    size = len(spectrometer.ring_buffer)
+    for block_no in range(size // spectrometer.frames_per_block + 3):  # Wraps around the ring
+        spectrometer.listen()
+    samples_total = spectrometer.stream.sample
+    assert list(spectrometer.ring_read(250)) == list(range(samples_total - 250, samples_total))
+    assert list(spectrometer.ring_read(size)) == list(range(samples_total - size, samples_total))
@@ -0,0 +1,62 @@
+import io
+import os
+
+from PIL import Image
+
+from cover_art import CoverArt, CoverArtCache
+
+
+def image_blob(color):
+    """ :return: PNG bytes of a small image in one color. """
+    file = io.BytesIO()
+    Image.new('RGB', (16, 16), color).save(file, 'PNG')
+    return file.getvalue()
+
+
+def cover_art_rendered(color):
+    cover_art = CoverArt(cover_dims=(8, 8), background_dims=(16, 8))
+    cover_art.render(image_blob(color))
+    return cover_art
+
+
+def entry_size(tmp_path):
+    """ :return: The size of one album's cover art in a cache. """
+    cache = CoverArtCache(str(tmp_path / 'measure'))
+    cache.save('album', cover_art_rendered((1, 2, 3)))
+    return sum(file.stat().st_size for file in (tmp_path / 'measure' / 'art').glob('*/*'))
+
+
+def test_cache_loads_saved_cover_art(tmp_path):
+    cache = CoverArtCache(str(tmp_path))
+    cover_art = cover_art_rendered((200, 10, 10))
+    cache.save('album', cover_art)
+    cover_art_loaded = CoverArt(cover_dims=(8, 8), background_dims=(16, 8))
+    assert cache.load('album', cover_art_loaded)
+    assert cover_art_loaded.colors == cover_art.colors
+    assert cover_art_loaded.cover.get_size() == (8, 8)
+    assert not cache.load('other album', CoverArt(cover_dims=(8, 8), background_dims=(16, 8)))
+
+
+def test_cache_evicts_least_recently_used_cover_art(tmp_path):
+    size = entry_size(tmp_path)
+    cache = CoverArtCache(str(tmp_path / 'cache'), size_max=size * 2.5)
+    cache.save('album 1', cover_art_rendered((255, 0, 0)))
+    cache.save('album 2', cover_art_rendered((0, 255, 0)))
+    assert cache.load('album 1', CoverArt(cover_dims=(8, 8), background_dims=(16, 8)))  # Used more recently
+    cache.save('album 3', cover_art_rendered((0, 0, 255)))
+    assert cache.load('album 1', CoverArt(cover_dims=(8, 8), background_dims=(16, 8)))
+    assert not cache.load('album 2', CoverArt(cover_dims=(8, 8), background_dims=(16, 8)))
+    assert cache.load('album 3', CoverArt(cover_dims=(8, 8), background_dims=(16, 8)))
+
+
+def test_cache_keeps_use_order_when_opened_again(tmp_path):
+    size = entry_size(tmp_path)
+    cache = CoverArtCache(str(tmp_path / 'cache'), size_max=size * 2.5)
+    cache.save('album 1', cover_art_rendered((255, 0, 0)))
+    cache.save('album 2', cover_art_rendered((0, 255, 0)))
+    art_hash = (tmp_path / 'cache' / 'albums' / 'album 1').read_text()
+    os.utime(str(tmp_path / 'cache' / 'art' / art_hash), (0, 0))  # Used long ago
+    cache = CoverArtCache(str(tmp_path / 'cache'), size_max=size * 2.5)
+    cache.save('album 3', cover_art_rendered((0, 0, 255)))
+    assert not cache.load('album 1', CoverArt(cover_dims=(8, 8), background_dims=(16, 8)))
+    assert cache.load('album 2', CoverArt(cover_dims=(8, 8), background_dims=(16, 8)))
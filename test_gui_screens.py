@@ -0,0 +1,89 @@
+import pygame
+
+from gui_screens import Screen, GestureDetector, LAYER_CACHE_SIZE, GESTURE_NONE, \
+    GESTURE_SWIPE_UP
+from gui_widgets import Widget
+
+
+class Swatch(Widget):
+    """ Widget filling its rectangle with a color, counting how often it's drawn. """
+
+    def __init__(self, name, screen, color):
+        Widget.__init__(self, name, screen, (10, 10), (20, 20))
+        self.color = color
+        self.draw_count = 0
+
+    def layer_state(self):
+        return self.color
+
+    def draw(self):
+        self.draw_count += 1
+        self.screen.fill(self.color, self.rect_get())
+
+
+def screen_with_swatch(color):
+    screen = Screen(pygame.Surface((100, 100)))
+    swatch = Swatch('swatch', screen.layer_background, color)
+    screen.add_component(swatch)
+    return screen, swatch
+
+
+def test_background_layer_composed_only_when_changed():
+    screen, swatch = screen_with_swatch((255, 0, 0))
+    assert screen.layer_background_render()
+    assert not screen.layer_background_render()
+    assert swatch.draw_count == 1
+    assert screen.layer_background.get_at((15, 15))[:3] == (255, 0, 0)
+    swatch.color = (0, 255, 0)
+    assert screen.layer_background_render()
+    assert screen.layer_background.get_at((15, 15))[:3] == (0, 255, 0)
+    assert swatch.draw_count == 2
+
+
+def test_background_layer_reused_from_cache():
+    screen, swatch = screen_with_swatch((255, 0, 0))
+    screen.layer_background_render()
+    layer_red = screen.layer_background
+    swatch.color = (0, 255, 0)
+    screen.layer_background_render()
+    swatch.color = (255, 0, 0)
+    assert screen.layer_background_render()
+    assert screen.layer_background is layer_red
+    assert swatch.draw_count == 2
+
+
+def test_background_layer_cache_is_bounded():
+    screen, swatch = screen_with_swatch((0, 0, 0))
+    for shade in range(LAYER_CACHE_SIZE + 5):
+        swatch.color = (shade, 0, 0)
+        screen.layer_background_render()
+    swatch.color = (0, 0, 0)  # Evicted as least recently used
+    screen.layer_background_render()
+    assert swatch.draw_count == LAYER_CACHE_SIZE + 6
+    assert screen.layer_background.get_at((15, 15))[:3] == (0, 0, 0)
+
+
+def mouse_event(event_type, pos):
+    return pygame.event.Event(event_type, pos=pos, button=1)
+
+
+def test_gesture_ends_on_mouse_up():
+    gesture_detect = GestureDetector()
+    assert gesture_detect.capture_gesture(mouse_event(pygame.MOUSEBUTTONDOWN, (50, 150))) == GESTURE_NONE
+    assert gesture_detect.capture_gesture(mouse_event(pygame.MOUSEBUTTONUP, (50, 50))) == GESTURE_SWIPE_UP
+    assert (gesture_detect.x_start, gesture_detect.y_start) == (50, 150)
+    assert gesture_detect.capture_gesture(mouse_event(pygame.MOUSEBUTTONUP, (50, 50))) == GESTURE_NONE
+
+
+def test_screen_relays_click_and_swipe():
+    screen, swatch = screen_with_swatch((255, 0, 0))
+    clicks = []
+    swipes = []
+    swatch.on_click = lambda x, y: clicks.append((x, y))
+    screen.on_swipe = lambda x, y, swipe_type: swipes.append(swipe_type)
+    screen.process_mouse_event(mouse_event(pygame.MOUSEBUTTONDOWN, (15, 15)))
+    assert screen.process_mouse_event(mouse_event(pygame.MOUSEBUTTONUP, (16, 15))) == 'swatch'
+    assert clicks == [(15, 15)]
+    screen.process_mouse_event(mouse_event(pygame.MOUSEBUTTONDOWN, (15, 90)))
+    screen.process_mouse_event(mouse_event(pygame.MOUSEBUTTONUP, (15, 10)))
+    assert swipes == [GESTURE_SWIPE_UP]
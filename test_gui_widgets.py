@@ -0,0 +1,115 @@
+import pygame
+import pytest
+from pygame import Rect
+
+from gui_widgets import ItemList, ItemSource, rects_merge, text_fit, text_render, text_cache, text_wrap, TEXT_CACHE_SIZE
+from settings import FONT, WHITE
+
+
+def test_rects_merge_joins_overlapping_rects():
+    merged = rects_merge([(0, 0, 10, 10), (5, 5, 10, 10), (100, 100, 5, 5)])
+    assert sorted(merged, key=lambda rect: rect.x) == [Rect(0, 0, 15, 15), Rect(100, 100, 5, 5)]
+
+
+def test_rects_merge_joins_rects_overlapping_a_merged_rect():
+    merged = rects_merge([(0, 0, 10, 10), (20, 0, 10, 10), (5, 0, 20, 5)])
+    assert merged == [Rect(0, 0, 30, 10)]
+
+
+def test_rects_merge_leaves_no_overlaps():
+    rects = [(x * 7 % 50, x * 13 % 50, 10, 10) for x in range(30)]
+    merged = rects_merge(rects)
+    assert all(rect.collidelist(merged[:index] + merged[index + 1:]) == -1 for index, rect in enumerate(merged))
+    assert all(Rect(rect).collidelist(merged) != -1 for rect in rects)
+
+
+def test_text_fit_finds_longest_fitting_beginning():
+    text = 'The quick brown fox jumps over the lazy dog'
+    for width in (0, 10, 100, 250):
+        fitted = text_fit(text, FONT, width)
+        assert text.startswith(fitted)
+        assert FONT.size(fitted)[0] <= width
+        assert fitted == text or FONT.size(text[:len(fitted) + 1])[0] > width
+    assert text_fit(text, FONT, 10000) == text
+
+
+def test_text_render_caches_renders():
+    text_cache.clear()
+    fitted, image = text_render('Cached caption', FONT, WHITE, 60)
+    assert fitted == text_fit('Cached caption', FONT, 60)
+    assert image.get_width() <= 60
+    assert text_render('Cached caption', FONT, WHITE, 60)[1] is image
+    assert text_render('Cached caption', FONT, WHITE)[1] is not image
+
+
+def test_text_render_cache_is_bounded():
+    text_cache.clear()
+    for number in range(TEXT_CACHE_SIZE + 10):
+        text_render(str(number), FONT, WHITE)
+    assert len(text_cache) == TEXT_CACHE_SIZE
+    assert ('0', FONT, WHITE, None) not in text_cache
+
+
+def test_text_wrap_fits_lines_in_width():
+    text = 'The quick brown fox jumps over the lazy dog ' * 5
+    lines = text_wrap(text, FONT, 200)
+    assert len(lines) > 1
+    assert all(FONT.size(line)[0] <= 200 for line in lines)
+    assert ' '.join(lines).split() == text.split()
+
+
+def test_text_wrap_breaks_long_words_and_newlines():
+    lines = text_wrap('a\n' + 'x' * 100, FONT, 100)
+    assert lines[0] == 'a'
+    assert ''.join(lines[1:]) == 'x' * 100
+    assert all(FONT.size(line)[0] <= 100 for line in lines)
+
+
+def test_text_wrap_keeps_empty_paragraphs():
+    assert text_wrap('a\n\nb', FONT, 100) == ['a', '', 'b']
+
+
+class Items(object):
+    """ Long list of items, recording which parts are fetched. """
+
+    def __init__(self, length):
+        self.length = length
+        self.fetched = []
+
+    def items_get(self, start, end):
+        self.fetched.append((start, end))
+        return ['Item %d' % number for number in range(start, min(end, self.length))]
+
+
+def test_item_source_behaves_like_a_list():
+    items = Items(1000)
+    source = ItemSource(lambda: items.length, items.items_get)
+    assert len(source) == 1000
+    assert source[5] == 'Item 5'
+    assert source[-1] == 'Item 999'
+    assert source[10:13] == ['Item 10', 'Item 11', 'Item 12']
+    with pytest.raises(IndexError):
+        source[1000]
+
+
+def test_item_list_only_fetches_items_showing():
+    items = Items(50000)
+    item_list = ItemList('list', pygame.Surface((400, 300)), (0, 0), (400, 300))
+    item_list.list_set(ItemSource(lambda: items.length, items.items_get))
+    item_list.draw()
+    rows = item_list.items_per_page
+    assert items.fetched == [(0, rows)]
+    item_list.show_next_items()
+    item_list.draw()
+    assert items.fetched[-1] == (rows, 2 * rows)
+    assert item_list.pages_count() == -(-50000 // rows)
+
+
+def test_item_list_click_selects_item_on_page_showing():
+    items = Items(100)
+    item_list = ItemList('list', pygame.Surface((400, 300)), (0, 0), (400, 300))
+    item_list.list_set(ItemSource(lambda: items.length, items.items_get))
+    item_list.show_next_items()
+    item_list.on_click(10, item_list.item_indent + item_list.item_height * 2 + 1)
+    assert item_list.item_selected_index == item_list.items_per_page + 2
+    assert item_list.item_selected_get() == 'Item %d' % (item_list.items_per_page + 2)
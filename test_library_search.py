@@ -0,0 +1,44 @@
+from library_search import SearchIndex, text_normalise, trigrams_get
+
+TEXTS = ['Miles Davis Kind of Blue So What',
+         'Miles Davis Kind of Blue Blue in Green',
+         'John Coltrane Blue Train Moment\'s Notice',
+         'Björk Homogenic Jóga',
+         'Daft Punk Discovery One More Time']
+
+
+def test_text_normalise_ignores_case_and_accents():
+    assert text_normalise('Björk Jóga') == 'bjork joga'
+
+
+def test_trigrams_pad_words_unless_partial():
+    assert trigrams_get('ab') == {' ab', 'ab '}
+    assert trigrams_get('ab', partial=True) == {' ab'}
+
+
+def test_search_finds_exact_match_first():
+    index = SearchIndex(TEXTS)
+    assert index.search('blue in green ')[0] == 1
+
+
+def test_search_finds_partly_typed_words():
+    index = SearchIndex(TEXTS)
+    assert index.search('coltr')[0] == 2
+    assert index.search('one more ti')[0] == 4
+
+
+def test_search_tolerates_typing_errors_and_accents():
+    index = SearchIndex(TEXTS)
+    assert index.search('bjork joga ')[0] == 3
+    assert set(index.search('miles daivs ')[:2]) == {0, 1}
+
+
+def test_search_without_matches_is_empty():
+    index = SearchIndex(TEXTS)
+    assert index.search('zzzz ') == []
+    assert index.search('') == []
+
+
+def test_search_limits_results():
+    index = SearchIndex(['Artist %d Song' % number for number in range(100)])
+    assert len(index.search('artist', limit=10)) == 10
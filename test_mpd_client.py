@@ -0,0 +1,438 @@
+import asyncio
+import contextlib
+from collections import deque
+
+import pytest
+from mpd import CommandError
+
+import mpd_client
+from mpd_client import MPDController, MPDLibrary, MPDQueue, QUEUE_WINDOW_SIZE, EVENT_QUEUE, song_record_get, retry
+
+
+class QueueClient(object):
+    """ Fakes mpd's answers about its queue. """
+
+    def __init__(self, length):
+        self.songs = [{'id': str(number), 'file': 'song%d.flac' % number} for number in range(length)]
+        self.changes = []
+        self.fetched = []
+        self.fail = False
+
+    async def playlistinfo(self, song_range):
+        start, end = (int(position) for position in song_range.split(':'))
+        self.fetched.append(start)
+        return self.songs[start:end]
+
+    async def plchangesposid(self, version):
+        if self.fail:
+            raise OSError('Connection lost')
+        return self.changes
+
+
+class StatusClient(object):
+    """ Fakes mpd's answers about its status and songs, keeping the commands sent. """
+
+    def __init__(self, length):
+        self.songs = [{'id': str(number), 'pos': str(number), 'file': 'song%d.flac' % number}
+                      for number in range(length)]
+        self.status_now = {'state': 'play', 'playlist': '1', 'playlistlength': str(length), 'volume': '50'}
+        self.song_set(0)
+        self.sent = []
+        self.refusals = 0  # Number of connection attempts still refused
+        self.connects = 0
+        self.next_song_gone = False
+
+    async def connect(self, host, port):
+        if self.refusals > 0:
+            self.refusals -= 1
+            raise ConnectionRefusedError('Connection refused')
+        self.connects += 1
+
+    def disconnect(self):
+        pass
+
+    async def ping(self):
+        pass
+
+    def song_set(self, position):
+        self.status_now.update({'song': str(position), 'songid': str(position), 'elapsed': '0.0',
+                                'nextsong': str(position + 1), 'nextsongid': str(position + 1)})
+
+    async def status(self):
+        self.sent.append('status')
+        return dict(self.status_now)
+
+    async def currentsong(self):
+        self.sent.append('currentsong')
+        return self.songs[int(self.status_now['song'])]
+
+    async def playlistid(self, song_id):
+        self.sent.append('playlistid')
+        if self.next_song_gone:
+            raise CommandError('[50@0] {playlistid} No such song')
+        return [song for song in self.songs if song['id'] == song_id]
+
+    async def playlistinfo(self, position):
+        self.sent.append('playlistinfo')
+        return self.songs[position:position + 1]
+
+    async def plchangesposid(self, version):
+        return []
+
+
+class PlayerClient(StatusClient):
+    """ Fakes mpd's answers to player commands, which can be held up or refused. """
+
+    def __init__(self, length):
+        StatusClient.__init__(self, length)
+        self.commands = []
+        self.answer = None  # Event mpd waits for before answering, None to answer right away
+        self.refused = set()  # Names of the commands mpd refuses
+
+    async def command_answer(self, name, *args):
+        self.commands.append((name,) + args)
+        if self.answer is not None:
+            await self.answer.wait()
+        if name in self.refused:
+            raise CommandError('[2@0] {%s} Bad song index' % name)
+
+    async def pause(self, state):
+        await self.command_answer('pause', state)
+        self.status_now['state'] = 'pause' if state == 1 else 'play'
+
+    async def next(self):
+        await self.command_answer('next')
+        self.song_set(int(self.status_now['song']) + 1)
+
+    async def setvol(self, volume):
+        await self.command_answer('setvol', volume)
+        self.status_now['volume'] = str(volume)
+
+
+async def player_connected(client):
+    """ :return: A controller connected to the client, with mpd's state fetched. """
+    controller = controller_get(client)
+    controller._MPDController__events_create()
+    controller._MPDController__connected.set()
+    await controller._MPDController__parse_mpc_status()
+    return controller
+
+
+async def commands_answered(controller):
+    """ Waits until the controller sent its player commands and took over mpd's state. """
+    await controller._MPDController__task_commands
+
+
+class LibraryClient(object):
+    """ Fakes mpd's music database, with songs in a directory per album and one song at the top level. """
+
+    def __init__(self):
+        self.db_update = '1'
+        self.directories = {'Blue': [{'file': 'Blue/%d.flac' % track, 'artist': 'Miles', 'album': 'Blue',
+                                      'title': 'Song %d' % track, 'track': '%d/2' % track} for track in (2, 1)],
+                            'Train': [{'directory': 'Train/CD1'},
+                                      {'file': 'Train/CD1/1.flac', 'artist': ['John', 'Lee'], 'album': 'Train',
+                                       'title': 'Locomotion', 'duration': '434.5'}]}
+
+    async def stats(self):
+        return {'db_update': self.db_update}
+
+    async def lsinfo(self):
+        return [{'directory': name} for name in self.directories] + [{'file': 'loose.mp3'}]
+
+    async def listallinfo(self, directory):
+        for entry in self.directories[directory]:
+            yield entry
+
+
+class ConnectionPool(object):
+    def __init__(self, client):
+        self.client = client
+
+    @contextlib.asynccontextmanager
+    async def connection(self, transfer=False):
+        yield self.client
+
+    def close(self):
+        pass
+
+
+async def queue_loaded(client, windows):
+    """ :return: A queue with the windows fetched. """
+    queue = MPDQueue(ConnectionPool(client), deque())
+    await queue.update({'playlist': '1', 'playlistlength': str(len(client.songs))})
+    for index in windows:
+        queue.songs_get(index * QUEUE_WINDOW_SIZE, index * QUEUE_WINDOW_SIZE + 1)
+    await asyncio.sleep(0)
+    client.fetched = []
+    return queue
+
+
+def controller_get(client):
+    """ :return: A controller getting mpd's state from the client and sending it commands. """
+    controller = MPDController('localhost')
+    controller.mpd_client = client
+    controller.mpd_commands = ConnectionPool(client)
+    controller.queue = MPDQueue(ConnectionPool(client), controller.events)
+    return controller
+
+
+def test_status_poll_fetches_songs_only_when_changed():
+    async def run():
+        client = StatusClient(4)
+        controller = controller_get(client)
+        await controller._MPDController__parse_mpc_status()
+        assert client.sent == ['status', 'currentsong', 'playlistid']
+        assert controller.next_song.file == 'song1.flac'
+        client.sent = []
+        client.status_now['elapsed'] = '1.0'
+        await controller._MPDController__parse_mpc_status()
+        assert client.sent == ['status']
+        client.sent = []
+        client.song_set(1)
+        await controller._MPDController__parse_mpc_status()
+        assert client.sent == ['status', 'currentsong', 'playlistid']
+        assert (controller.now_playing.file, controller.next_song.file) == ('song1.flac', 'song2.flac')
+    asyncio.run(run())
+
+
+def test_idle_event_pipelines_songs_only_for_player_changes():
+    async def run():
+        client = StatusClient(4)
+        controller = controller_get(client)
+        await controller._MPDController__parse_mpc_status()
+        client.sent = []
+        client.status_now['volume'] = '60'
+        await controller._MPDController__parse_idle(['mixer'])
+        assert client.sent == ['status']
+        assert controller.volume == 60
+        client.sent = []
+        client.song_set(1)
+        await controller._MPDController__parse_idle(['player'])
+        assert client.sent == ['status', 'currentsong', 'playlistinfo']  # The next song was guessed right
+        assert (controller.now_playing.file, controller.next_song.file) == ('song1.flac', 'song2.flac')
+    asyncio.run(run())
+
+
+def test_song_record_takes_first_tag_value():
+    song = song_record_get({'id': '1', 'file': 'a.flac', 'artist': ['A', 'B'], 'album': 'X', 'title': ['T', 'U']})
+    assert (song.artist, song.album, song.title) == ('A', 'X', 'T')
+
+
+def test_song_record_of_radio_takes_station_name():
+    song = song_record_get({'id': '1', 'file': 'http://radio', 'name': 'Station'})
+    assert (song.title, song.album) == ('', 'Station')
+    assert song_record_get({}) is None
+
+
+def test_queue_fetches_windows_when_needed():
+    async def run():
+        client = QueueClient(250)
+        queue = await queue_loaded(client, [])
+        assert len(queue) == 250
+        assert queue.songs_get(0, 3) == [None, None, None]
+        await asyncio.sleep(0)
+        assert [song.file for song in queue.songs_get(0, 3)] == ['song0.flac', 'song1.flac', 'song2.flac']
+        assert client.fetched == [0]
+        assert EVENT_QUEUE in queue.events
+    asyncio.run(run())
+
+
+def test_queue_update_fetches_only_changed_windows():
+    async def run():
+        client = QueueClient(250)
+        queue = await queue_loaded(client, [0, 1])
+        client.songs[150] = {'id': '1000', 'file': 'new.flac'}
+        client.changes = [{'cpos': '150', 'id': '1000'}]
+        assert await queue.update({'playlist': '2', 'playlistlength': '250'})
+        assert queue.songs_get(0, 1)[0].file == 'song0.flac'
+        assert queue.songs_get(150, 151) == [None]
+        await asyncio.sleep(0)
+        assert queue.songs_get(150, 151)[0].file == 'new.flac'
+        assert client.fetched == [QUEUE_WINDOW_SIZE]
+    asyncio.run(run())
+
+
+def test_queue_update_same_version_changes_nothing():
+    async def run():
+        queue = await queue_loaded(QueueClient(10), [0])
+        assert not await queue.update({'playlist': '1', 'playlistlength': '10', 'song': '3'})
+        assert queue.position == 3
+    asyncio.run(run())
+
+
+def test_queue_update_shortens_queue():
+    async def run():
+        client = QueueClient(250)
+        queue = await queue_loaded(client, [0, 2])
+        await queue.update({'playlist': '2', 'playlistlength': '120'})
+        assert len(queue) == 120
+        assert len(queue.songs_get(0, 200)) == 120
+        assert client.fetched == []
+    asyncio.run(run())
+
+
+def test_queue_update_failing_is_tried_again():
+    async def run():
+        client = QueueClient(10)
+        queue = await queue_loaded(client, [0])
+        client.songs[5] = {'id': '1000', 'file': 'new.flac'}
+        client.changes = [{'cpos': '5', 'id': '1000'}]
+        client.fail = True
+        with pytest.raises(OSError):
+            await queue.update({'playlist': '2', 'playlistlength': '10'})
+        client.fail = False
+        assert await queue.update({'playlist': '2', 'playlistlength': '10'})
+        assert queue.songs_get(5, 6) == [None]
+        await asyncio.sleep(0)
+        assert queue.songs_get(5, 6)[0].file == 'new.flac'
+    asyncio.run(run())
+
+
+def test_library_opens_its_database_when_used(tmp_path):
+    library = MPDLibrary(ConnectionPool(LibraryClient()), str(tmp_path / 'cache' / 'library.db'))
+    assert not (tmp_path / 'cache').exists()
+    assert library.artists_get() == []
+    assert (tmp_path / 'cache' / 'library.db').exists()
+
+
+def test_library_sync_fills_index_once_per_database_update(tmp_path):
+    async def run():
+        client = LibraryClient()
+        library = MPDLibrary(ConnectionPool(client), str(tmp_path / 'library.db'))
+        assert await library.sync()
+        assert library.artists_get() == ['', 'John', 'Miles']
+        assert [song.title for song in library.songs_get(artist='Miles')] == ['Song 1', 'Song 2']
+        assert not await library.sync()
+        client.db_update = '2'
+        client.directories.pop('Train')
+        assert await library.sync()
+        assert library.albums_get() == ['', 'Blue']
+        reopened = MPDLibrary(ConnectionPool(client), str(tmp_path / 'library.db'))
+        assert reopened.db_update_get() == '2'
+    asyncio.run(run())
+
+
+def test_retry_waits_longer_after_each_failure(monkeypatch):
+    waits = []
+
+    async def sleep(seconds):
+        waits.append(seconds)
+    monkeypatch.setattr(mpd_client.asyncio, 'sleep', sleep)
+    failures = [OSError('Connection refused')] * 3
+
+    async def connect():
+        if len(failures) > 0:
+            raise failures.pop()
+        return 'connected'
+    assert asyncio.run(retry(connect, ex_type=OSError, wait_ms=100, wait_max_ms=300, jitter=0)) == 'connected'
+    assert waits == [0.1, 0.2, 0.3]
+
+
+def test_retry_gives_up():
+    async def connect():
+        raise OSError('Connection refused')
+
+    async def fail():
+        raise ValueError('Not a connection error')
+    with pytest.raises(OSError):
+        asyncio.run(retry(connect, ex_type=OSError, limit=2, wait_ms=1))
+    with pytest.raises(ValueError):
+        asyncio.run(retry(fail, ex_type=OSError, wait_ms=1))
+
+
+def test_supervisor_reconnects(monkeypatch, tmp_path):
+    monkeypatch.setattr(mpd_client, 'RECONNECT_WAIT_MIN', 1)
+
+    async def run():
+        client = StatusClient(4)
+        client.refusals = 2
+        controller = controller_get(client)
+        controller.library = MPDLibrary(ConnectionPool(LibraryClient()), str(tmp_path / 'library.db'))
+        controller.supervise()
+        assert await controller.connection_wait(1)
+        assert controller.now_playing.file == 'song0.flac'
+        controller.connection_lost()
+        assert not controller.is_connected()
+        assert await controller.connection_wait(1)
+        assert client.connects == 2
+        controller.disconnect()
+    asyncio.run(run())
+
+
+def test_status_update_survives_next_song_gone():
+    async def run():
+        client = StatusClient(4)
+        client.next_song_gone = True
+        controller = controller_get(client)
+        controller._MPDController__events_create()
+        controller._MPDController__connected.set()
+        assert await controller.status_get()
+        assert controller.now_playing.file == 'song0.flac'
+        assert controller.next_song is None
+    asyncio.run(run())
+
+
+def test_player_command_changes_state_before_mpd_answers():
+    async def run():
+        client = PlayerClient(4)
+        controller = await player_connected(client)
+        client.answer = asyncio.Event()
+        controller.player_control_set('pause')
+        assert await controller.player_control_get() == 'pause'
+        assert controller.is_ahead()
+        await asyncio.sleep(0)
+        await controller._MPDController__parse_idle(['mixer'])  # Reports mpd still playing
+        assert await controller.player_control_get() == 'pause'
+        client.answer.set()
+        await commands_answered(controller)
+        assert not controller.is_ahead()
+        assert client.commands == [('pause', 1)]
+        assert await controller.player_control_get() == 'pause'
+    asyncio.run(run())
+
+
+def test_volume_commands_waiting_are_replaced():
+    async def run():
+        client = PlayerClient(4)
+        controller = await player_connected(client)
+        client.answer = asyncio.Event()
+        controller.volume_set(60)
+        await asyncio.sleep(0)
+        for volume in (70, 80, 90):
+            controller.volume_set(volume)
+        assert controller.volume == 90
+        client.answer.set()
+        await commands_answered(controller)
+        assert client.commands == [('setvol', 60), ('setvol', 90)]
+        assert controller.volume == 90
+    asyncio.run(run())
+
+
+def test_refused_command_rolls_back():
+    async def run():
+        client = PlayerClient(4)
+        client.refused.add('next')
+        controller = await player_connected(client)
+        controller.player_control_set('next')
+        controller.volume_set(80)
+        assert (controller.now_playing.file, controller.volume) == ('song1.flac', 80)
+        await commands_answered(controller)
+        assert client.commands == [('next',)]  # The commands after the refused one are dropped
+        assert (controller.now_playing.file, controller.volume) == ('song0.flac', 50)
+        assert not controller.is_ahead()
+    asyncio.run(run())
+
+
+def test_unanswered_command_rolls_back(monkeypatch):
+    monkeypatch.setattr(mpd_client, 'CONNECT_TIMEOUT', 0.01)
+
+    async def run():
+        client = PlayerClient(4)
+        controller = await player_connected(client)
+        client.answer = asyncio.Event()
+        controller.player_control_set('pause')
+        await commands_answered(controller)
+        assert await controller.player_control_get() == 'play'
+        assert not controller.is_ahead()
+    asyncio.run(run())